@@ -0,0 +1,24 @@
+"""
+Headless temple generation - everything here runs without maya.cmds.
+
+catalog - loads the dungeon_resources JSON presets, cached with their geometry
+geometry - OBJ geometry as flat arrays
+terrain - height queries over the terrain vertices
+collision - analytical box collision
+meshcollision - triangle BVH collision of the precise mode
+occupancy - chunked occupancy grid of the 10 unit lattice
+connectors - open connectors hashed by world position
+frontier - open outputs with the placement candidates known to fail
+compatibility - placement candidates the catalog alone rules out
+store - growable arrays and interned ids for the layout bookkeeping
+presets - per rotation tables of the block presets
+sampling - weighted preset samplers per tag
+snapshots - per stage random streams and the cache of stage results
+layout - computes a full temple as plain data
+layoutfile - temples saved as arrays with a JSON sidecar
+export - temples merged into large meshes, streamed to OBJ or binary glTF
+tiles - large worlds generated tile by tile and stitched
+control - time budget, cancel token and progress of a generation
+instrumentation - stage timers and counters, JSON and Chrome trace export
+benchmark - synthetic catalogs and the layout benchmark
+"""
@@ -0,0 +1,232 @@
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import catalog, layout, terrain
+from .instrumentation import Recorder
+
+
+"""
+Benchmark - layout stages over fixed seeds on a synthetic catalog
+
+    python -m dungeon.benchmark --save-baseline benchmark.json
+    python -m dungeon.benchmark --baseline benchmark.json
+
+syntheticPack writes a dungeon_resources folder of any size; its rooms are variations of
+    market - large infrastructure, many connectors, rare (Market424)
+    bridge - long and thin infrastructure/bridge, few connectors (Bridge123)
+    block - small base rooms with side and top outputs (Block111, ShortStreet112)
+    stairs - one input below, one output a step higher (Stairs121)
+plus the pillar, grass and tree props. Every scale sets baseAmount and structureAmount.
+
+Reported per scale: blocks/sec, collision checks/sec, success rate (placed base and
+infrastructure blocks out of the requested amount) and peak traced memory of one run.
+Compared against a baseline, a scale regresses when its blocks/sec drops by more than
+the tolerance.
+"""
+
+SCALES=[15,30,100,1000]
+SEEDS=["0","1","2"]
+
+CUBE_OBJ="""v 0 0 0
+v 10 0 0
+v 10 0 10
+v 0 0 10
+v 0 10 0
+v 10 10 0
+v 10 10 10
+v 0 10 10
+f 1 2 3 4
+f 5 8 7 6
+f 1 5 6 2
+f 2 6 7 3
+f 3 7 8 4
+f 4 8 5 1
+"""
+
+#Synthetic catalog
+def sideConnectors(sizeX,sizeZ,height,density,rng):
+    #connectors in the middle of the side cells at one height, each kept with the density chance
+    points=[]
+    for i in range(sizeX):
+        points.append([10*i+5,height,0])
+        points.append([10*i+5,height,10*sizeZ])
+    for j in range(sizeZ):
+        points.append([0,height,10*j+5])
+        points.append([10*sizeX,height,10*j+5])
+    kept=[point for point in points if rng.random()<density]
+    return kept or points[:1]
+
+def footprintConnectors(sizeX,sizeZ,density,rng):
+    #inputs on the floor, the block can rest on an output below it
+    points=[[10*i+5,0,10*j+5] for i in range(sizeX) for j in range(sizeZ)]
+    kept=[point for point in points if rng.random()<density]
+    return kept or points[:1]
+
+def roomPreset(shape,rng,density):
+    if shape=="market":
+        sizeX,sizeY,sizeZ=rng.randint(3,4),2,rng.randint(3,4)
+        tags,freq=["infrastructure"],0.1
+        outputs=sideConnectors(sizeX,sizeZ,5,density,rng)
+        inputs=outputs+footprintConnectors(sizeX,sizeZ,density,rng)
+    elif shape=="bridge":
+        sizeX,sizeY,sizeZ=1,2,rng.randint(3,5)
+        tags,freq=["bridge","infrastructure"],0.3
+        outputs=[[5,5,0],[5,5,10*sizeZ]]
+        inputs=outputs+[[5,0,5],[5,0,10*sizeZ-5]]
+    elif shape=="stairs":
+        sizeX,sizeY,sizeZ=1,4,1
+        tags,freq=["stairs"],1
+        inputs=[[5,0,5]]
+        outputs=[[5,5,10]]
+    else:
+        sizeX,sizeY,sizeZ=rng.randint(1,2),1,rng.randint(1,4)
+        tags,freq=["base"],1
+        outputs=sideConnectors(sizeX,sizeZ,5,min(1,density*1.5),rng)+[[5,10*sizeY,5]]
+        inputs=sideConnectors(sizeX,sizeZ,5,min(1,density*1.5),rng)
+
+    data={"size_x":sizeX,"size_y":sizeY,"size_z":sizeZ,"tags":tags,"freq":freq,
+        "connector_input":inputs,"connector_output":outputs}
+    if shape!="stairs":
+        data["pillars"]=[[0,0,0],[10*(sizeX-1),0,10*(sizeZ-1)]]
+        data["props"]=[[rng.choice(["tree","grass"]),round(rng.random(),2),rng.randint(-3,3),10*sizeY,rng.randint(-3,3)]
+            for i in range(rng.randint(0,4))]
+    return data
+
+def syntheticPack(path,rooms=40,density=0.6,mix=None,seed=0):
+    #mix - shape - share of the rooms; at least one room of every shape is written
+    mix=mix or {"block":0.5,"market":0.15,"bridge":0.2,"stairs":0.15}
+    rng=random.Random(seed)
+    for kind in ("rooms","props"):
+        if not os.path.exists(os.path.join(path,kind)):
+            os.makedirs(os.path.join(path,kind))
+
+    shapes=list(mix)
+    counts=dict((shape,max(1,int(round(rooms*mix[shape])))) for shape in shapes)
+    for shape in shapes:
+        for i in range(counts[shape]):
+            name=shape.capitalize()+str(i)
+            with open(os.path.join(path,"rooms",name+".json"),"w") as fileHandle:
+                json.dump(roomPreset(shape,rng,density),fileHandle)
+            with open(os.path.join(path,"rooms",name+".obj"),"w") as fileHandle:
+                fileHandle.write(CUBE_OBJ)
+
+    props={"Pillar111":{"size_y":1,"tags":["pillar"],"freq":1},
+        "Grass111":{"size_y":1,"tags":["grass"],"freq":1},
+        "Tree121":{"size_y":2,"tags":["tree"],"freq":1},
+        "Tree141":{"size_y":4,"tags":["tree"],"freq":1}}
+    for name,data in props.items():
+        with open(os.path.join(path,"props",name+".json"),"w") as fileHandle:
+            json.dump(data,fileHandle)
+        with open(os.path.join(path,"props",name+".obj"),"w") as fileHandle:
+            fileHandle.write(CUBE_OBJ)
+    return path
+
+def syntheticTerrain(radius=300,spacing=10,seed=0):
+    #a rolling disc, heights between 10 and 90
+    rng=np.random.RandomState(seed)
+    phase=rng.uniform(0,2*math.pi,2)
+    x,z=np.meshgrid(np.arange(-radius,radius+spacing,spacing,dtype=float),
+        np.arange(-radius,radius+spacing,spacing,dtype=float),indexing="ij")
+    inside=x**2+z**2<=radius**2
+    x,z=x[inside],z[inside]
+    y=50+40*np.sin(x/60+phase[0])*np.cos(z/70+phase[1])
+    return terrain.Terrain(np.stack([x,y,z],axis=1))
+
+#Running
+def runOnce(dungeonBlocksData,ground,seed,scale):
+    recorder=Recorder()
+    generator=layout.LayoutGenerator(dungeonBlocksData,ground,seed,recorder=recorder)
+    generator.baseAmount=scale
+    generator.structureAmount=scale
+    start=time.perf_counter()
+    temple=generator.generate()
+    seconds=time.perf_counter()-start
+    grown=len(recorder.observations.get("candidatesPerBlock",())) #blocks placed by appendBlocks
+    return {"seconds":seconds,
+        "blocks":len(temple.blocks),
+        "checks":recorder.counters.get("collisionChecks",0),
+        "success":float(grown)/(2*scale)}
+
+def peakMemory(dungeonBlocksData,ground,seed,scale):
+    tracemalloc.start()
+    try:
+        generator=layout.LayoutGenerator(dungeonBlocksData,ground,seed)
+        generator.baseAmount=scale
+        generator.structureAmount=scale
+        generator.generate()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def runBenchmark(scales=SCALES,seeds=SEEDS,rooms=40,density=0.6,output=sys.stdout):
+    folder=tempfile.mkdtemp(prefix="dungeon_benchmark")
+    try:
+        dungeonBlocksData=catalog.loadCatalog(syntheticPack(folder,rooms,density),useCache=False)
+    finally:
+        shutil.rmtree(folder)
+    ground=syntheticTerrain()
+
+    results={}
+    for scale in scales:
+        runs=[runOnce(dungeonBlocksData,ground,seed,scale) for seed in seeds]
+        seconds=sum(run["seconds"] for run in runs)
+        results[str(scale)]={"seconds":seconds,
+            "blocksPerSecond":sum(run["blocks"] for run in runs)/seconds,
+            "checksPerSecond":sum(run["checks"] for run in runs)/seconds,
+            "successRate":sum(run["success"] for run in runs)/len(runs),
+            "peakMemory":peakMemory(dungeonBlocksData,ground,seeds[0],scale)}
+        output.write("scale %5d  %8.1f blocks/s  %10.0f checks/s  success %5.1f%%  peak %7.1f MB  %6.2fs\n"%(
+            scale,results[str(scale)]["blocksPerSecond"],results[str(scale)]["checksPerSecond"],
+            100*results[str(scale)]["successRate"],results[str(scale)]["peakMemory"]/1e6,seconds))
+    return {"settings":{"seeds":list(seeds),"rooms":rooms,"density":density},"results":results}
+
+def compare(report,baseline,tolerance=0.2):
+    #scales whose blocks/sec fell more than tolerance below the baseline
+    regressions=[]
+    for scale,result in report["results"].items():
+        reference=baseline["results"].get(scale)
+        if reference is None:
+            continue
+        ratio=result["blocksPerSecond"]/reference["blocksPerSecond"]
+        if ratio<1-tolerance:
+            regressions.append((scale,ratio))
+    return regressions
+
+def main(arguments=None):
+    parser=argparse.ArgumentParser(description="Benchmark the layout stages on a synthetic catalog.")
+    parser.add_argument("--scales",type=int,nargs="+",default=SCALES,help="baseAmount/structureAmount values")
+    parser.add_argument("--seeds",nargs="+",default=SEEDS)
+    parser.add_argument("--rooms",type=int,default=40,help="room presets in the synthetic catalog")
+    parser.add_argument("--density",type=float,default=0.6,help="share of the side cells holding a connector")
+    parser.add_argument("--baseline",help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline",help="write the results as a baseline JSON")
+    parser.add_argument("--tolerance",type=float,default=0.2,help="allowed blocks/sec drop against the baseline")
+    arguments=parser.parse_args(arguments)
+
+    report=runBenchmark(arguments.scales,arguments.seeds,arguments.rooms,arguments.density)
+    if arguments.save_baseline:
+        with open(arguments.save_baseline,"w") as fileHandle:
+            json.dump(report,fileHandle,indent=1,sort_keys=True)
+    if arguments.baseline:
+        with open(arguments.baseline,"r") as fileHandle:
+            baseline=json.load(fileHandle)
+        if baseline.get("settings")!=report["settings"]:
+            sys.stdout.write("warning: the baseline was made with other settings\n")
+        regressions=compare(report,baseline,arguments.tolerance)
+        for scale,ratio in regressions:
+            sys.stdout.write("scale %s regressed to %.0f%% of the baseline blocks/s\n"%(scale,100*ratio))
+        return 1 if regressions else 0
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import os
+import json
+
+import numpy as np
+
+from .geometry import FIELDS, GeometryLibrary, parseObj
+from .presets import buildRotationTables
+from .sampling import buildSamplers
+from .snapshots import catalogFingerprints
+
+
+"""
+dungeonBlocksData{}
+    blocklist - list of block names
+    propList - list of prop names
+    <tag>List - list of blocks/props of that tag
+    rooms + blockName - json data
+    props + propName - json data
+    rotations + blockName - PresetRotations, rotated connectors/pillars/props/box of the block
+    compatibility - CompatibilityTable, the candidates an output's own block rules out
+    samplers - WeightedSampler per (rooms/props, tag)
+    fingerprints - content hashes of the presets, "structure" (no prop spawns) and "full"
+    geometry - GeometryLibrary with the parsed OBJ of every preset ("rooms/"+blockName, "props/"+propName)
+
+The parsed catalog is cached in dungeon_resources/catalog.npz. The cache stores the
+modification time and size of every .json/.obj it was built from and is rebuilt as soon
+as one of them changes, appears or disappears.
+"""
+
+CACHE_NAME="catalog.npz"
+CACHE_VERSION=2
+
+def listResources(folder,extension='.json'):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(file for file in os.listdir(folder) if file.endswith(extension))
+
+def resourceManifest(resourcePath):
+    manifest=[]
+    for kind in ("rooms","props"):
+        for extension in (".json",".obj"):
+            for file in listResources(os.path.join(resourcePath,kind),extension):
+                stat=os.stat(os.path.join(resourcePath,kind,file))
+                manifest.append([kind+"/"+file,stat.st_mtime_ns,stat.st_size])
+    return sorted(manifest)
+
+#Validation
+def isPoint(value,length=3):
+    return isinstance(value,list) and len(value)==length and all(isinstance(v,(int,float)) for v in value)
+
+def validatePreset(kind,name,data):
+    problems=[]
+    if not isinstance(data.get("tags"),list) or not all(isinstance(tag,str) for tag in data.get("tags",[])):
+        problems.append("tags must be a list of names")
+    if not isinstance(data.get("freq"),(int,float)) or data.get("freq")<0:
+        problems.append("freq must be a number of at least 0")
+    if kind=="rooms":
+        for size in ("size_x","size_y","size_z"):
+            if not isinstance(data.get(size),int) or data.get(size)<=0:
+                problems.append(size+" must be a positive whole number")
+        for key in ("connector_input","connector_output"):
+            if not isinstance(data.get(key),list) or not all(isPoint(point) for point in data.get(key,[])):
+                problems.append(key+" must be a list of x,y,z coordinates")
+        if not all(isPoint(point) for point in data.get("pillars",[])):
+            problems.append("pillars must be a list of x,y,z coordinates")
+        for prop in data.get("props",[]):
+            if not (isinstance(prop,list) and len(prop)==5 and isinstance(prop[0],str) and isPoint(prop[1:],4)):
+                problems.append("props must be a list of [type, chance, x, y, z]")
+                break
+        if "stairs" in data.get("tags",[]) and not data.get("connector_input"):
+            problems.append("stairs need at least one connector_input")
+    else:
+        if not isinstance(data.get("size_y",1),int) or data.get("size_y",1)<=0:
+            problems.append("size_y must be a positive whole number")
+
+    if problems:
+        raise ValueError(kind+"/"+name+".json: "+"; ".join(problems))
+
+#Building
+def readPresets(resourcePath):
+    presets={"rooms":{},"props":{}}
+    meshes=[]
+    for kind in ("rooms","props"):
+        for file in listResources(os.path.join(resourcePath,kind)):
+            name=file.replace('.json','')
+            with open(os.path.join(resourcePath,kind,file), "r") as fileHandle:
+                data=json.load(fileHandle)
+            validatePreset(kind,name,data)
+            objPath=os.path.join(resourcePath,kind,name+".obj")
+            if not os.path.exists(objPath):
+                raise ValueError(kind+"/"+name+".json has no matching "+name+".obj")
+            presets[kind][name]=data
+            meshes.append((kind+"/"+name,parseObj(objPath)))
+    return presets,GeometryLibrary.fromMeshes(meshes)
+
+def saveCache(path,manifest,presets,geometry):
+    arrays={"header":np.array(json.dumps({"version":CACHE_VERSION,"manifest":manifest,
+        "presets":presets,"names":geometry.names,"materials":geometry.materials}))}
+    for field in FIELDS:
+        arrays[field]=geometry.arrays[field]
+        arrays[field+"Offsets"]=geometry.offsets[field]
+    temporaryPath=path+"."+str(os.getpid())+".tmp" #several farm workers may build it at once
+    try:
+        with open(temporaryPath,"wb") as fileHandle:
+            np.savez(fileHandle,**arrays)
+        os.replace(temporaryPath,path)
+    except OSError: #a read-only resource folder only loses the cache
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+
+def loadCache(path,manifest):
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path,allow_pickle=False) as cache:
+            header=json.loads(str(cache["header"]))
+            if header.get("version")!=CACHE_VERSION or header.get("manifest")!=manifest:
+                return None
+            arrays=dict((field,cache[field]) for field in FIELDS)
+            offsets=dict((field,cache[field+"Offsets"]) for field in FIELDS)
+    except (OSError,ValueError,KeyError):
+        return None
+    return header["presets"],GeometryLibrary(header["names"],arrays,offsets,header["materials"])
+
+def compileCatalog(resourcePath,useCache=True):
+    manifest=resourceManifest(resourcePath)
+    cachePath=os.path.join(resourcePath,CACHE_NAME)
+    cached=loadCache(cachePath,manifest) if useCache else None
+    if cached is not None:
+        return cached
+    presets,geometry=readPresets(resourcePath)
+    if useCache:
+        saveCache(cachePath,manifest,presets,geometry)
+    return presets,geometry
+
+def loadCatalog(resourcePath,useCache=True):
+    presets,geometry=compileCatalog(resourcePath,useCache)
+    dungeonBlocksData={"blockList":[],
+        "baseList":[],
+        "infrastructureList":[],
+        "bridgeList":[],
+        "stairsList":[],
+
+        "propList":[],
+        "pillarList":[],
+        "treeList":[],
+        "grassList":[]
+    }
+    #Blocks
+    for blockName in sorted(presets["rooms"]):
+        dungeonBlocksData["rooms"+blockName]=presets["rooms"][blockName]
+        dungeonBlocksData["blockList"].append(blockName)
+        for tag in dungeonBlocksData["rooms"+blockName]["tags"]:
+            dungeonBlocksData.setdefault(tag+"List",[]).append(blockName)
+    #Props
+    for propName in sorted(presets["props"]):
+        dungeonBlocksData["props"+propName]=presets["props"][propName]
+        dungeonBlocksData["propList"].append(propName)
+        for tag in dungeonBlocksData["props"+propName]["tags"]:
+            dungeonBlocksData.setdefault(tag+"List",[]).append(propName)
+
+    dungeonBlocksData["geometry"]=geometry
+    dungeonBlocksData["fingerprints"]=catalogFingerprints(presets)
+    buildRotationTables(dungeonBlocksData)
+    buildSamplers(dungeonBlocksData)
+    return dungeonBlocksData
@@ -0,0 +1,142 @@
+import numpy as np
+
+from .occupancy import CHUNK_SIZE, BedrockFloor, OccupancyGrid
+
+
+"""
+Analytical collision between axis aligned boxes
+    box - (minX,minY,minZ,maxX,maxY,maxZ) in world space
+    touching boxes never collide, only a shared volume does
+
+CollisionWorld marks boxes sitting on the 10 unit lattice in an OccupancyGrid, so checking
+them costs the same however many blocks were placed. The few boxes off the lattice (props,
+blocks snapped to a half-height connector) are kept in unions of UNION_SIZE boxes, like the
+old collisionUnion meshes, and a union is only searched when its bounds are hit.
+With regions set, a box also collides when it does not lie inside one of the rectangles;
+tiled generation uses it to keep every tile and stitch within its own ground.
+With meshes set (a meshcollision.MeshWorld), boxes added with a shape go there instead, and
+a box tested with a shape only collides with them where their triangles do.
+"""
+
+UNION_SIZE=15 #amount of boxes in a single union
+WINDOW_CELLS=64**3 #largest dense window collidesMany builds, candidates spread wider are split by chunk
+
+def boxesCollide(box1,box2):
+    return (box1[0]<box2[3] and box2[0]<box1[3] and
+        box1[1]<box2[4] and box2[1]<box1[4] and
+        box1[2]<box2[5] and box2[2]<box1[5])
+
+def boxesOverlapMany(boxes,others):
+    #(n,6) and (m,6) arrays - (n,m) bool, True where a box shares volume with another
+    return ((boxes[:,None,0]<others[None,:,3]) & (others[None,:,0]<boxes[:,None,3]) &
+        (boxes[:,None,1]<others[None,:,4]) & (others[None,:,1]<boxes[:,None,4]) &
+        (boxes[:,None,2]<others[None,:,5]) & (others[None,:,2]<boxes[:,None,5]))
+
+def rotatedBoxes(size_x,size_y,size_z):
+    #local box of a block for each of the four 90 degree rotations around its origin
+    #rotation 90 maps (x,z) to (z,-x), 180 to (-x,-z), 270 to (-z,x)
+    return {0:(0,0,0,size_x,size_y,size_z),
+        90:(0,0,-size_x,size_z,size_y,0),
+        180:(-size_x,0,-size_z,0,size_y,0),
+        270:(-size_z,0,0,0,size_y,size_x)}
+
+def mergeBoxes(box1,box2):
+    return (min(box1[0],box2[0]),min(box1[1],box2[1]),min(box1[2],box2[2]),
+        max(box1[3],box2[3]),max(box1[4],box2[4]),max(box1[5],box2[5]))
+
+
+class CollisionWorld(object):
+    def __init__(self,terrain=None,cellSize=10):
+        self.grid=OccupancyGrid(cellSize)
+        self.floor=BedrockFloor(terrain,cellSize) if terrain is not None else None #bedrock, skipped when None
+        self.unions=[] #[bounds,[boxes]] - boxes that do not sit on the lattice
+        self.others=None #every union box as one array, rebuilt after a change
+        self.regions=None #(n,4) minX,minZ,maxX,maxZ rectangles boxes have to stay in, None for anywhere
+        self.meshes=None #MeshWorld of the precise mode, None tests every shape as its box
+
+    def add(self,box,shape=None):
+        if shape is not None and self.meshes is not None:
+            self.meshes.add(box,shape)
+            return
+        if self.grid.isAligned(box):
+            self.grid.mark(box)
+            return
+        self.others=None
+        if not self.unions or len(self.unions[-1][1])>=UNION_SIZE:
+            self.unions.append([box,[box]])
+        else:
+            union=self.unions[-1]
+            union[0]=mergeBoxes(union[0],box)
+            union[1].append(box)
+
+    def remove(self,box,shape=None):
+        #rolls back an add of the same box
+        if shape is not None and self.meshes is not None:
+            self.meshes.remove(box)
+            return
+        if self.grid.isAligned(box):
+            self.grid.unmark(box)
+            return
+        self.others=None
+        for union in reversed(self.unions):
+            if box in union[1]:
+                union[1].remove(box)
+                return
+
+    def insideRegions(self,boxes):
+        #(n,6) boxes - True where a box lies completely inside one of the regions
+        boxes=np.asarray(boxes,dtype=float).reshape(-1,6)
+        if self.regions is None:
+            return np.ones(len(boxes),dtype=bool)
+        regions=np.asarray(self.regions,dtype=float).reshape(-1,4)
+        return ((boxes[:,None,0]>=regions[None,:,0]) & (boxes[:,None,2]>=regions[None,:,1]) &
+            (boxes[:,None,3]<=regions[None,:,2]) & (boxes[:,None,5]<=regions[None,:,3])).any(axis=1)
+
+    def collides(self,box,shape=None):
+        if self.regions is not None and not self.insideRegions(box)[0]:
+            return True
+        if not self.grid.isFree(box):
+            return True
+        for bounds,boxes in self.unions:
+            if not boxesCollide(bounds,box):
+                continue
+            for other in boxes:
+                if boxesCollide(other,box):
+                    return True
+        if self.meshes is not None and self.meshes.collides(box,shape):
+            return True
+        if self.floor is not None:
+            return self.floor.collides(box)
+        return False
+
+    def collidesMany(self,boxes,shapes=None):
+        #boxes - (n,6) array, one vectorized pass for every candidate
+        #shapes - (name,rotations,translations) of the boxes for the meshes, see meshcollision
+        boxes=np.asarray(boxes,dtype=float).reshape(-1,6)
+        cellSize=float(self.grid.cellSize)
+        low=np.floor(boxes[:,:3]/cellSize).astype(np.int64)
+        high=np.ceil(boxes[:,3:]/cellSize).astype(np.int64)
+        if len(boxes)>1 and np.prod((high.max(axis=0)-low.min(axis=0)).astype(float))>WINDOW_CELLS:
+            groups,inverse=np.unique(low//(4*CHUNK_SIZE),axis=0,return_inverse=True)
+            inverse=inverse.reshape(-1)
+            if len(groups)>1:
+                collided=np.empty(len(boxes),dtype=bool)
+                for group in range(len(groups)):
+                    members=inverse==group
+                    groupShapes=None if shapes is None else (shapes[0],np.asarray(shapes[1])[members],np.asarray(shapes[2])[members])
+                    collided[members]=self.collidesMany(boxes[members],groupShapes)
+                return collided
+        collided=self.grid.occupiedMany(low,high)
+
+        if self.others is None:
+            self.others=np.array([other for bounds,members in self.unions for other in members],dtype=float).reshape(-1,6)
+        if len(self.others) and len(boxes):
+            collided|=boxesOverlapMany(boxes,self.others).any(axis=1)
+
+        if self.meshes is not None:
+            collided|=self.meshes.collidesMany(boxes,shapes)
+        if self.floor is not None and len(boxes):
+            collided|=boxes[:,1]<self.floor.highestMany(low[:,[0,2]],high[:,[0,2]])
+        if self.regions is not None:
+            collided|=~self.insideRegions(boxes)
+        return collided
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+"""
+Connector compatibility - the placement candidates that can never work, known from the catalog
+    output class - the box of an output's block relative to the output; outputs of any preset
+                   and rotation with the same one share it, classOf gives its integer id
+    CompatibilityTable - per block preset a (classes,inputs) uint8 bitmask, bit r set when the
+                         input snapped onto an output of the class in rotation index r puts the
+                         block inside the block the output belongs to; built on the first use
+                         of the preset, a layout only ever asks for the presets it places
+
+That block is placed before its outputs open, so such a candidate collides whatever else the
+layout holds. Heights and facings that do not fit (an inner y=0 input on an outer y=5 output,
+an input on the wrong side) all end up there. With meshCollision boxes are only the broad
+phase, an open block such as a bridge may wrap around another one, so the tables are not used.
+"""
+
+class CompatibilityTable(object):
+    def __init__(self,presetNames,presetRotations):
+        #presetNames - block presets in id order, presetRotations - their PresetRotations
+        self.presetNames=list(presetNames)
+        self.presetRotations=list(presetRotations)
+        outputs=np.array([rotations.outputs.shape[1] for rotations in self.presetRotations],dtype=np.int64)
+        self.outputOffsets=np.concatenate([[0],np.cumsum(4*outputs)[:-1]]).astype(np.int64)
+
+        #Every (preset, rotation index, output) slot, the box of its block relative to the output;
+        #catalogs reuse a handful of block sizes and connector spots, so there are few classes
+        relativeBoxes=np.zeros((int(np.sum(4*outputs)),6))
+        for preset,rotations in enumerate(self.presetRotations):
+            members=slice(self.outputOffsets[preset],self.outputOffsets[preset]+4*outputs[preset])
+            positions=rotations.outputs.reshape(-1,3)
+            relativeBoxes[members]=np.repeat(rotations.boxes,outputs[preset],axis=0)-np.concatenate([positions,positions],axis=1)
+        self.classBoxes,self.outputClasses=np.unique(relativeBoxes,axis=0,return_inverse=True)
+        self.outputClasses=self.outputClasses.reshape(-1).astype(np.int64)
+        self.cache={} #preset id - bits, filled by bits()
+
+    def __len__(self):
+        return len(self.classBoxes)
+
+    def classOf(self,presetId,rotation,output):
+        #rotation - rotation index
+        return int(self.outputClasses[self.outputOffsets[presetId]+rotation*self.presetRotations[presetId].outputs.shape[1]+output])
+
+    def bits(self,presetId):
+        bits=self.cache.get(presetId)
+        if bits is None:
+            bits=self.cache[presetId]=self.overlaps(presetId)
+        return bits
+
+    def overlaps(self,presetId):
+        #bits of the candidates whose box shares volume with the box of the output's block,
+        #both relative to the output
+        rotations=self.presetRotations[presetId]
+        inputs=np.concatenate([rotations.inputs,rotations.inputs],axis=2)
+        boxes=(rotations.boxes[:,None,:]-inputs)[None]
+        other=self.classBoxes[:,None,None,:]
+        overlap=np.all((boxes[...,:3]<other[...,3:]) & (other[...,:3]<boxes[...,3:]),axis=3)
+        bits=np.zeros((len(self),max(1,rotations.inputs.shape[1])),dtype=np.uint8)
+        for rotation in range(4):
+            bits[:,:overlap.shape[2]]|=overlap[:,rotation].astype(np.uint8)<<rotation
+        return bits
@@ -0,0 +1,57 @@
+"""
+ConnectorIndex - open connectors hashed by their quantized world position
+    iteration follows insertion order, like the old connector lists
+    at / near - every open connector on a position or at a fixed offset from it
+"""
+
+QUANTUM=1 #connector positions are whole units
+KEY_BITS=21 #bits per axis of a position key, positions stay within +-2**20 quanta
+KEY_OFFSET=1<<(KEY_BITS-1)
+
+def positionKey(position):
+    #the three quantized coordinates packed into one integer
+    return (((int(round(position[0]/QUANTUM))+KEY_OFFSET)<<(2*KEY_BITS))|
+        ((int(round(position[1]/QUANTUM))+KEY_OFFSET)<<KEY_BITS)|
+        (int(round(position[2]/QUANTUM))+KEY_OFFSET))
+
+
+class ConnectorIndex(object):
+    def __init__(self):
+        self.connectors={} #connector - insertion number, keeps the order for iteration
+        self.cells={} #position key - [connectors], in insertion order
+        self.counter=0
+
+    def __len__(self):
+        return len(self.connectors)
+
+    def __iter__(self):
+        return iter(list(self.connectors))
+
+    def __contains__(self,conn):
+        return conn in self.connectors
+
+    def add(self,conn):
+        self.connectors[conn]=self.counter
+        self.counter+=1
+        self.cells.setdefault(positionKey(conn.position),[]).append(conn)
+
+    def remove(self,conn):
+        if conn not in self.connectors:
+            return
+        del self.connectors[conn]
+        key=positionKey(conn.position)
+        cell=self.cells[key]
+        cell.remove(conn) #a cell holds the few connectors sharing a position
+        if not cell:
+            del self.cells[key]
+
+    def at(self,position):
+        return list(self.cells.get(positionKey(position),()))
+
+    def near(self,position,offsets):
+        #connectors at any of the offsets, in insertion order
+        found=[]
+        for offset in offsets:
+            found.extend(self.at((position[0]+offset[0],position[1]+offset[1],position[2]+offset[2])))
+        found.sort(key=self.connectors.get)
+        return found
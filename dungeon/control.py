@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+"""
+Control of a running generation
+    CancelToken - set from any thread, the generator stops at its next check
+    RunControl - wall clock budget, cancel token and progress callback of one generate()
+
+progress(stage,done,total) is called when a stage starts, for every block it places and when
+it ends; it runs on the generating thread, a UI has to hand it over to its own thread.
+Once shouldStop is True it stays True and stopReason says why ("budget" or "cancelled").
+"""
+
+class CancelToken(object):
+    def __init__(self):
+        self.event=threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+
+class RunControl(object):
+    def __init__(self,budget=None,cancelToken=None,progress=None):
+        self.budget=budget #seconds, None for no limit
+        self.cancelToken=cancelToken
+        self.progress=progress
+        self.start=time.perf_counter()
+        self.stopReason=None
+
+    def shouldStop(self):
+        if self.stopReason is None:
+            if self.cancelToken is not None and self.cancelToken.cancelled:
+                self.stopReason="cancelled"
+            elif self.budget is not None and time.perf_counter()-self.start>self.budget:
+                self.stopReason="budget"
+        return self.stopReason is not None
+
+    def report(self,stage,done,total=None):
+        if self.progress is not None:
+            self.progress(stage,done,total)
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+from . import catalog, layoutfile
+from .geometry import triangulate
+from .presets import rotateAll, rotationIndex
+
+
+"""
+Export - a finished temple merged into a few large meshes, streamed to OBJ or binary glTF
+    placement - (geometry name, tag, rotation index, translation), see layoutPlacements
+    groupBy - "none" one mesh, "tag" one per placement tag, "cell" one per cellSize square
+
+    python -m dungeon.export temple temple.glb --group tag
+
+Placements of the same preset are transformed together, BATCH_VERTICES vertices at a time,
+and written out straight away, so memory does not grow with the size of the temple. The glTF
+buffer is streamed to temporary files and copied behind the JSON chunk once its size is known.
+Faces are triangulated; OBJ keeps the positions and uvs of the presets, glTF gets one vertex
+per face corner. Normals and materials are not written.
+"""
+
+BATCH_VERTICES=1<<18 #vertices transformed and written per pass
+CELL_SIZE=200 #side of the squares of groupBy "cell"
+GROUPS=["none","tag","cell"]
+
+def layoutPlacements(layout):
+    #placements of a Layout; pillars and props are never rotated
+    placements=[("rooms/"+block.preset,block.tag,rotationIndex(block.rotation),block.translation) for block in layout.blocks]
+    for placement in layout.pillars+layout.props:
+        placements.append(("props/"+placement.preset,placement.tag,0,placement.translation))
+    return placements
+
+def filePlacements(header,arrays):
+    #placements of a layout file, without rebuilding its blocks
+    placements=[("rooms/"+preset,tag,rotationIndex(rotation),translation)
+        for preset,tag,rotation,translation in layoutfile.placements(header,arrays,"blocks")]
+    for section in ("pillars","props"):
+        placements.extend(("props/"+preset,tag,0,translation)
+            for preset,tag,rotation,translation in layoutfile.placements(header,arrays,section))
+    return placements
+
+def groupPlacements(placements,groupBy="none",cellSize=CELL_SIZE):
+    #group name - geometry name - (rotations,translations), groups and presets in sorted order
+    if groupBy not in GROUPS:
+        raise ValueError("groupBy has to be one of "+", ".join(GROUPS))
+    groups={}
+    for name,tag,rotation,translation in placements:
+        if groupBy=="tag":
+            group=tag
+        elif groupBy=="cell":
+            group="cell_%d_%d"%(int(np.floor(translation[0]/cellSize)),int(np.floor(translation[2]/cellSize)))
+        else:
+            group="temple"
+        groups.setdefault(group,{}).setdefault(name,[]).append((rotation,translation))
+    return [(group,[(name,np.array([entry[0] for entry in entries],dtype=np.int64),
+        np.array([entry[1] for entry in entries],dtype=float).reshape(-1,3)) for name,entries in sorted(presets.items())])
+        for group,presets in sorted(groups.items())]
+
+
+class PresetMesh(object):
+    #a preset prepared for export, rotated once for each of the four rotations
+    def __init__(self,geometry):
+        corners=triangulate(geometry["faceCounts"])
+        faceIndices=np.asarray(geometry["faceIndices"],dtype=np.int64)
+        faceUvIndices=np.asarray(geometry["faceUvIndices"],dtype=np.int64)
+        self.hasUvs=len(geometry["uvs"])>0 and (faceUvIndices>=0).all()
+        #OBJ - shared positions and uvs
+        self.positions=rotateAll(geometry["vertices"])
+        self.uvs=np.asarray(geometry["uvs"],dtype=float).reshape(-1,2)
+        self.triangles=faceIndices[corners]
+        self.uvTriangles=faceUvIndices[corners] if self.hasUvs else None
+        #glTF - one vertex per face corner
+        self.cornerPositions=self.positions[:,faceIndices]
+        self.cornerUvs=self.uvs[faceUvIndices] if self.hasUvs else np.zeros((len(faceIndices),2))
+        self.cornerTriangles=corners
+
+    def batches(self,rotations,translations,vertices):
+        #(rotations,translations) slices with at most BATCH_VERTICES vertices each
+        step=max(1,BATCH_VERTICES//max(1,vertices))
+        for start in range(0,len(rotations),step):
+            yield rotations[start:start+step],translations[start:start+step]
+
+
+class Exporter(object):
+    def __init__(self,geometry):
+        self.geometry=geometry #GeometryLibrary of the catalog
+        self.meshes={} #geometry name - PresetMesh
+
+    def mesh(self,name):
+        if name not in self.meshes:
+            if name not in self.geometry:
+                raise ValueError("The catalog has no geometry for "+name)
+            self.meshes[name]=PresetMesh(self.geometry.get(name))
+        return self.meshes[name]
+
+    def export(self,path,placements,groupBy="none",cellSize=CELL_SIZE):
+        groups=groupPlacements(placements,groupBy,cellSize)
+        extension=os.path.splitext(path)[1].lower()
+        if extension==".obj":
+            return self.writeObj(path,groups)
+        if extension==".glb":
+            return self.writeGlb(path,groups)
+        raise ValueError("Unknown export format "+extension+", use .obj or .glb")
+
+    #OBJ
+    def writeObj(self,path,groups):
+        counts={"vertices":0,"triangles":0,"meshes":len(groups)}
+        uvCount=0
+        with open(path,"w") as fileHandle:
+            fileHandle.write("# temple, %d meshes\n"%len(groups))
+            for group,presets in groups:
+                fileHandle.write("o %s\n"%group)
+                for name,rotations,translations in presets:
+                    mesh=self.mesh(name)
+                    for batchRotations,batchTranslations in mesh.batches(rotations,translations,len(mesh.positions[0])):
+                        positions=mesh.positions[batchRotations]+batchTranslations[:,None]
+                        fileHandle.write(("v %.4f %.4f %.4f\n"*(positions.size//3))%tuple(positions.ravel().tolist()))
+                        offsets=counts["vertices"]+len(mesh.positions[0])*np.arange(len(batchRotations))
+                        triangles=(mesh.triangles[None]+offsets[:,None,None]+1).reshape(-1,3)
+                        if mesh.hasUvs:
+                            fileHandle.write(("vt %.4f %.4f\n"*(len(mesh.uvs)*len(batchRotations)))%
+                                tuple(np.tile(mesh.uvs,(len(batchRotations),1)).ravel().tolist()))
+                            uvOffsets=uvCount+len(mesh.uvs)*np.arange(len(batchRotations))
+                            uvTriangles=(mesh.uvTriangles[None]+uvOffsets[:,None,None]+1).reshape(-1,3)
+                            corners=np.stack([triangles,uvTriangles],axis=2).ravel().tolist()
+                            fileHandle.write(("f %d/%d %d/%d %d/%d\n"*len(triangles))%tuple(corners))
+                            uvCount+=len(mesh.uvs)*len(batchRotations)
+                        else:
+                            fileHandle.write(("f %d %d %d\n"*len(triangles))%tuple(triangles.ravel().tolist()))
+                        counts["vertices"]+=len(mesh.positions[0])*len(batchRotations)
+                        counts["triangles"]+=len(triangles)
+        return counts
+
+    #glTF
+    def writeGlb(self,path,groups):
+        #every group is a mesh with one primitive; its positions, uvs and indices are streamed to three
+        #temporary files and appended to the buffer file once the group is done
+        counts={"vertices":0,"triangles":0,"meshes":len(groups)}
+        document={"asset":{"version":"2.0","generator":"dungeon.export"},
+            "scene":0,"scenes":[{"nodes":list(range(len(groups)))}],
+            "nodes":[],"meshes":[],"accessors":[],"bufferViews":[],"buffers":[]}
+        folder=tempfile.mkdtemp(prefix="temple")
+        try:
+            bufferPath=os.path.join(folder,"buffer.bin")
+            with open(bufferPath,"wb") as bufferHandle:
+                for group,presets in groups:
+                    partPaths=[os.path.join(folder,part) for part in ("positions","uvs","indices")]
+                    parts=[open(partPath,"wb") for partPath in partPaths]
+                    vertexCount=0
+                    indexCount=0
+                    low=np.full(3,np.inf)
+                    high=np.full(3,-np.inf)
+                    try:
+                        for name,rotations,translations in presets:
+                            mesh=self.mesh(name)
+                            corners=len(mesh.cornerUvs)
+                            for batchRotations,batchTranslations in mesh.batches(rotations,translations,corners):
+                                positions=mesh.cornerPositions[batchRotations]+batchTranslations[:,None]
+                                low=np.minimum(low,positions.reshape(-1,3).min(axis=0))
+                                high=np.maximum(high,positions.reshape(-1,3).max(axis=0))
+                                offsets=vertexCount+corners*np.arange(len(batchRotations))
+                                indices=mesh.cornerTriangles[None]+offsets[:,None,None]
+                                parts[0].write(positions.astype("<f4").tobytes())
+                                parts[1].write(np.tile(mesh.cornerUvs,(len(batchRotations),1)).astype("<f4").tobytes())
+                                parts[2].write(indices.astype("<u4").tobytes())
+                                vertexCount+=corners*len(batchRotations)
+                                indexCount+=indices.size
+                    finally:
+                        for part in parts:
+                            part.close()
+
+                    #Buffer views and accessors of the group
+                    attributes={}
+                    for partPath,key,accessorType,componentType,target,amount in (
+                            (partPaths[0],"POSITION","VEC3",5126,34962,vertexCount),
+                            (partPaths[1],"TEXCOORD_0","VEC2",5126,34962,vertexCount),
+                            (partPaths[2],"indices","SCALAR",5125,34963,indexCount)):
+                        offset=bufferHandle.tell()
+                        with open(partPath,"rb") as partHandle:
+                            shutil.copyfileobj(partHandle,bufferHandle)
+                        document["bufferViews"].append({"buffer":0,"byteOffset":offset,
+                            "byteLength":bufferHandle.tell()-offset,"target":target})
+                        accessor={"bufferView":len(document["bufferViews"])-1,"componentType":componentType,
+                            "count":amount,"type":accessorType}
+                        if key=="POSITION" and amount:
+                            accessor["min"]=low.tolist()
+                            accessor["max"]=high.tolist()
+                        document["accessors"].append(accessor)
+                        attributes[key]=len(document["accessors"])-1
+                    indices=attributes.pop("indices")
+                    document["meshes"].append({"name":group,"primitives":[{"attributes":attributes,"indices":indices,"mode":4}]})
+                    document["nodes"].append({"name":group,"mesh":len(document["meshes"])-1})
+                    counts["vertices"]+=vertexCount
+                    counts["triangles"]+=indexCount//3
+                bufferLength=bufferHandle.tell()
+            document["buffers"].append({"byteLength":bufferLength})
+
+            #GLB - header, JSON chunk padded with spaces, BIN chunk padded with zeros
+            header=json.dumps(document,separators=(",",":")).encode("utf-8")
+            header+=b" "*(-len(header)%4)
+            padding=-bufferLength%4
+            with open(path,"wb") as fileHandle:
+                fileHandle.write(struct.pack("<III",0x46546C67,2,12+8+len(header)+8+bufferLength+padding))
+                fileHandle.write(struct.pack("<II",len(header),0x4E4F534A))
+                fileHandle.write(header)
+                fileHandle.write(struct.pack("<II",bufferLength+padding,0x004E4942))
+                with open(bufferPath,"rb") as bufferHandle:
+                    shutil.copyfileobj(bufferHandle,fileHandle)
+                fileHandle.write(b"\0"*padding)
+        finally:
+            shutil.rmtree(folder,ignore_errors=True)
+        return counts
+
+def exportLayout(path,layout,dungeonBlocksData,groupBy="none",cellSize=CELL_SIZE):
+    #layout - a Layout, the format comes from the extension of path (.obj or .glb)
+    return Exporter(dungeonBlocksData["geometry"]).export(path,layoutPlacements(layout),groupBy,cellSize)
+
+def main(arguments=None):
+    parser=argparse.ArgumentParser(description="Export a temple layout file as merged meshes.")
+    parser.add_argument("layout",help="layout file written by dungeon.layoutfile")
+    parser.add_argument("output",help=".obj or .glb file")
+    parser.add_argument("--resources",default="dungeon_resources",help="dungeon_resources folder")
+    parser.add_argument("--group",choices=GROUPS,default="none",help="one mesh, one per tag or one per cell")
+    parser.add_argument("--cell-size",type=float,default=CELL_SIZE,help="side of a cell for --group cell")
+    arguments=parser.parse_args(arguments)
+
+    header,arrays=layoutfile.readLayout(arguments.layout)
+    geometry=catalog.loadCatalog(arguments.resources)["geometry"]
+    counts=Exporter(geometry).export(arguments.output,filePlacements(header,arrays),arguments.group,arguments.cell_size)
+    sys.stdout.write("%d meshes, %d vertices, %d triangles\n"%(counts["meshes"],counts["vertices"],counts["triangles"]))
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import catalog, layout, terrain
+from .instrumentation import Recorder
+
+
+"""
+Seed farm - generates many seeds headlessly across a process pool
+
+    python -m dungeon.farm --terrain terrain.json --seeds 0:1000 --output temples.jsonl
+
+Every seed is generated on its own, from its own seed string, so a record only depends on
+the seed and the parameters - never on the amount of workers or the order they finish in.
+Records are written in seed order, one JSON line per seed.
+"""
+
+#state of a worker process, loaded once by its initializer
+workerState={}
+
+def parseSeeds(values):
+    #"0:100" is a range, anything else a single seed string
+    seeds=[]
+    for value in values:
+        if ":" in value:
+            start,stop=value.split(":",1)
+            seeds.extend(str(seed) for seed in range(int(start),int(stop)))
+        else:
+            seeds.append(value)
+    return seeds
+
+def parsePropSpacing(value):
+    #"tree=15" - the distance has to be above 0, spaceProps divides by it
+    tag,separator,distance=value.partition("=")
+    try:
+        distance=float(distance)
+    except ValueError:
+        distance=None
+    if not separator or distance is None or not distance>0:
+        raise argparse.ArgumentTypeError("expected TAG=DISTANCE with a distance above 0, got "+value)
+    return tag,distance
+
+def initWorker(resourcePath,terrainPath):
+    workerState["dungeonBlocksData"]=catalog.loadCatalog(resourcePath)
+    workerState["terrain"]=terrain.loadTerrain(terrainPath)
+
+def generateSeed(seed,parameters,includeLayout=True,includeStats=False):
+    start=time.perf_counter()
+    recorder=Recorder() if includeStats else None
+    generator=layout.LayoutGenerator(workerState["dungeonBlocksData"],workerState["terrain"],seed,recorder=recorder)
+    for key,value in parameters.items():
+        setattr(generator,key,value)
+
+    record={"seed":seed,"parameters":generator.parameters()}
+    try:
+        temple=generator.generate()
+    except ValueError as error:
+        record["error"]=str(error)
+        return record
+
+    record["blocks"]=len(temple.blocks)
+    record["pillars"]=len(temple.pillars)
+    record["props"]=len(temple.props)
+    record["failures"]=generator.failures
+    record["timings"]=dict(generator.timings,total=time.perf_counter()-start)
+    if includeStats:
+        record["stats"]=recorder.toDict()
+    if includeLayout:
+        record["layout"]=temple.toDict()
+    return record
+
+def runFarm(seeds,parameters,resourcePath,terrainPath,output,workers=None,includeLayout=True,includeStats=False):
+    #writes one line per seed to output, in seed order
+    workers=workers or os.cpu_count() or 1
+    catalog.loadCatalog(resourcePath) #builds the cache once before the workers read it
+    chunksize=max(1,len(seeds)//(workers*8))
+    with ProcessPoolExecutor(max_workers=workers,initializer=initWorker,initargs=(resourcePath,terrainPath)) as executor:
+        records=executor.map(generateSeed,seeds,[parameters]*len(seeds),[includeLayout]*len(seeds),[includeStats]*len(seeds),
+            chunksize=chunksize)
+        for record in records:
+            output.write(json.dumps(record)+"\n")
+            output.flush()
+
+def main(arguments=None):
+    parser=argparse.ArgumentParser(description="Generate temple layouts for many seeds in parallel.")
+    parser.add_argument("--seeds",nargs="+",required=True,help="seed strings, or start:stop for a range of whole numbers")
+    parser.add_argument("--terrain",required=True,help="JSON list of terrain vertex positions")
+    parser.add_argument("--resources",default="dungeon_resources",help="dungeon_resources folder")
+    parser.add_argument("--output",default="-",help="JSONL file, - for stdout")
+    parser.add_argument("--workers",type=int,default=None,help="worker processes, one per core by default")
+    parser.add_argument("--base-amount",type=int,default=15)
+    parser.add_argument("--structure-amount",type=int,default=15)
+    parser.add_argument("--distance-amount",type=int,default=200)
+    parser.add_argument("--roots-amount",type=float,default=1.0)
+    parser.add_argument("--prop-spacing",nargs="*",type=parsePropSpacing,default=[],metavar="TAG=DISTANCE",help="least distance between props of a tag")
+    parser.add_argument("--mesh-collision",action="store_true",help="test blocks with their triangles instead of their boxes")
+    parser.add_argument("--no-layout",action="store_true",help="only write the counts and timings")
+    parser.add_argument("--stats",action="store_true",help="add the instrumentation counters of every seed")
+    arguments=parser.parse_args(arguments)
+
+    parameters={"baseAmount":arguments.base_amount,
+        "structureAmount":arguments.structure_amount,
+        "distanceAmount":arguments.distance_amount,
+        "rootsAmount":arguments.roots_amount,
+        "propSpacing":dict(arguments.prop_spacing),
+        "meshCollision":arguments.mesh_collision}
+    seeds=parseSeeds(arguments.seeds)
+
+    if arguments.output=="-":
+        runFarm(seeds,parameters,arguments.resources,arguments.terrain,sys.stdout,arguments.workers,not arguments.no_layout,arguments.stats)
+    else:
+        with open(arguments.output,"w") as output:
+            runFarm(seeds,parameters,arguments.resources,arguments.terrain,output,arguments.workers,not arguments.no_layout,arguments.stats)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,106 @@
+import numpy as np
+
+
+"""
+Frontier - the open outputs blocks can grow from, with the placements known to fail
+    ids - every output gets the next id when it opens, the order of the open outputs
+    classes - output class (compatibility) of every id, the open outputs bucketed by the kind
+              of candidates that can work on them
+    dead - per preset id, a bitmask of the rotations that collided for every (output id, input)
+    retired - per tag, outputs every candidate of every preset of the tag failed on
+
+Blocks are only ever added while the layout grows, so a candidate that collided once
+collides for good; dead candidates are skipped without a collision check. An output is
+retired for a tag once all its candidates are dead. Given staticBits (preset id - the
+CompatibilityTable bits of its candidates, or None), every output opens with the candidates
+its class rules out already dead, they never reach collision.
+
+Dead never changes which candidate is picked, it only skips ones that would fail. Retired
+outputs are left out of the pairs appendBlocks shuffles, but a tag only retires outputs in the
+stage that grows blocks of it and every stage starts with an empty table for its tag, so a
+frontier rebuilt from a snapshot with an empty cache still places the same blocks.
+"""
+
+ALL_ROTATIONS=0b1111 #dead bits of a candidate that collided in every rotation
+
+class Frontier(object):
+    def __init__(self,capacity=256,staticBits=None):
+        self.connectors=[] #id - connector
+        self.ids={} #open connector - id
+        self.staticBits=staticBits #preset id - (classes,inputs) uint8 or None, see compatibility
+        self.positions=np.zeros((capacity,3))
+        self.classes=np.zeros(capacity,dtype=np.int64)
+        self.open=np.zeros(capacity,dtype=bool)
+        self.dead={} #preset id - (capacity,inputs) uint8, bit r set when rotation index r collided
+        self.retired={} #tag - (capacity,) bool
+
+    def __len__(self):
+        return len(self.ids)
+
+    def grow(self):
+        capacity=2*len(self.open)
+        def extend(array):
+            grown=np.zeros((capacity,)+array.shape[1:],dtype=array.dtype)
+            grown[:len(array)]=array
+            return grown
+        self.positions=extend(self.positions)
+        self.classes=extend(self.classes)
+        self.open=extend(self.open)
+        self.dead=dict((preset,extend(array)) for preset,array in self.dead.items())
+        self.retired=dict((tag,extend(array)) for tag,array in self.retired.items())
+
+    def add(self,conn,outputClass=0):
+        if len(self.connectors)==len(self.open):
+            self.grow()
+        index=len(self.connectors)
+        self.connectors.append(conn)
+        self.ids[conn]=index
+        self.positions[index]=conn.position
+        self.classes[index]=outputClass
+        self.open[index]=True
+        if self.staticBits is not None:
+            for preset,table in self.dead.items():
+                bits=self.staticBits(preset)
+                if bits is not None:
+                    table[index]=bits[outputClass,:table.shape[1]]
+
+    def remove(self,conn):
+        index=self.ids.pop(conn,None)
+        if index is not None:
+            self.open[index]=False
+
+    def openIds(self):
+        return np.flatnonzero(self.open[:len(self.connectors)])
+
+    def deadTable(self,preset,inputs):
+        table=self.dead.get(preset)
+        if table is None:
+            table=self.dead[preset]=np.zeros((len(self.open),max(1,inputs)),dtype=np.uint8)
+            bits=self.staticBits(preset) if self.staticBits is not None else None
+            if bits is not None:
+                count=len(self.connectors)
+                table[:count]=bits[self.classes[:count],:table.shape[1]]
+        return table
+
+    def retiredTable(self,tag):
+        table=self.retired.get(tag)
+        if table is None:
+            table=self.retired[tag]=np.zeros(len(self.open),dtype=bool)
+        return table
+
+    def isDead(self,preset,inputs,ids,inputIndices,rotations):
+        return (self.deadTable(preset,inputs)[ids,inputIndices]>>rotations)&1==1
+
+    def markDead(self,preset,inputs,ids,inputIndices,rotations,tagPresets,tag):
+        #tagPresets - preset id - input amount of every preset the tag can spawn; returns newly retired outputs
+        np.bitwise_or.at(self.deadTable(preset,inputs),(ids,inputIndices),(1<<rotations).astype(np.uint8))
+        retired=self.retiredTable(tag)
+        touched=np.unique(ids)
+        touched=touched[~retired[touched]]
+        blocked=np.ones(len(touched),dtype=bool)
+        for other,otherInputs in tagPresets.items():
+            blocked&=(self.deadTable(other,otherInputs)[touched,:max(1,otherInputs)]==ALL_ROTATIONS).all(axis=1)
+            if not blocked.any():
+                return 0
+        retired[touched[blocked]]=True
+        return int(blocked.sum())
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+"""
+Preset geometry as flat arrays
+    vertices - (n,3) float32 positions
+    faceCounts - vertices per face
+    faceIndices - vertex index of every face corner, 0 based
+    uvs - (n,2) float32 texture coordinates
+    faceUvIndices - uv index of every face corner, -1 where the OBJ has none
+    normals - (n,3) float32 vn normals
+    faceNormalIndices - normal index of every face corner, -1 where the OBJ has none
+    faceSmoothing - smoothing group of every face, 0 for "s off"
+    faceMaterials - index of every face's usemtl material in materials, -1 for none
+    materials - material names of the preset, in first use order (not an array field)
+
+GeometryLibrary keeps every preset back to back in one set of arrays; get returns views,
+so fetching a preset's geometry never copies or touches the disk.
+"""
+
+FIELDS=["vertices","faceCounts","faceIndices","uvs","faceUvIndices","normals","faceNormalIndices",
+    "faceSmoothing","faceMaterials"]
+FLOAT_FIELDS={"vertices":3,"uvs":2,"normals":3} #field - values per row
+
+def objIndex(value,amount):
+    #OBJ indices start at 1, negative ones count back from the end
+    index=int(value)
+    return index-1 if index>0 else amount+index
+
+def triangulate(faceCounts):
+    #(t,3) face corners of every triangle, each face fanned out from its first corner
+    counts=np.asarray(faceCounts,dtype=np.int64)
+    triangleCounts=np.maximum(counts-2,0)
+    fan=np.repeat(np.cumsum(counts)-counts,triangleCounts) #first corner of the face of every triangle
+    step=np.arange(len(fan))-np.repeat(np.cumsum(triangleCounts)-triangleCounts,triangleCounts)
+    return np.stack([fan,fan+step+1,fan+step+2],axis=1)
+
+def parseObj(path):
+    vertices=[]
+    uvs=[]
+    normals=[]
+    faceCounts=[]
+    faceIndices=[]
+    faceUvIndices=[]
+    faceNormalIndices=[]
+    faceSmoothing=[]
+    faceMaterials=[]
+    materials=[]
+    smoothing=0
+    material=-1
+    with open(path,"r") as fileHandle:
+        for line in fileHandle:
+            values=line.split()
+            if not values:
+                continue
+            if values[0]=="v":
+                vertices.append([float(value) for value in values[1:4]])
+            elif values[0]=="vt":
+                uvs.append([float(value) for value in values[1:3]])
+            elif values[0]=="vn":
+                normals.append([float(value) for value in values[1:4]])
+            elif values[0]=="s":
+                smoothing=int(values[1]) if len(values)>1 and values[1].isdigit() else 0
+            elif values[0]=="usemtl":
+                name=" ".join(values[1:])
+                if name not in materials:
+                    materials.append(name)
+                material=materials.index(name)
+            elif values[0]=="f":
+                corners=values[1:]
+                faceCounts.append(len(corners))
+                faceSmoothing.append(smoothing)
+                faceMaterials.append(material)
+                for corner in corners:
+                    parts=corner.split("/")
+                    faceIndices.append(objIndex(parts[0],len(vertices)))
+                    faceUvIndices.append(objIndex(parts[1],len(uvs)) if len(parts)>1 and parts[1] else -1)
+                    faceNormalIndices.append(objIndex(parts[2],len(normals)) if len(parts)>2 and parts[2] else -1)
+
+    return {"vertices":np.array(vertices,dtype=np.float32).reshape(-1,3),
+        "faceCounts":np.array(faceCounts,dtype=np.int32),
+        "faceIndices":np.array(faceIndices,dtype=np.int32),
+        "uvs":np.array(uvs,dtype=np.float32).reshape(-1,2),
+        "faceUvIndices":np.array(faceUvIndices,dtype=np.int32),
+        "normals":np.array(normals,dtype=np.float32).reshape(-1,3),
+        "faceNormalIndices":np.array(faceNormalIndices,dtype=np.int32),
+        "faceSmoothing":np.array(faceSmoothing,dtype=np.int32),
+        "faceMaterials":np.array(faceMaterials,dtype=np.int32),
+        "materials":materials}
+
+
+class GeometryLibrary(object):
+    def __init__(self,names,arrays,offsets,materials=None):
+        self.names=list(names) #"rooms/Block111", "props/Tree121", ...
+        self.lookup=dict((name,i) for i,name in enumerate(self.names))
+        self.arrays=arrays #field - flat array of every preset
+        self.offsets=offsets #field - (len(names)+1) start of every preset
+        self.materials=materials if materials is not None else [[] for name in self.names] #material names of every preset
+
+    @classmethod
+    def fromMeshes(cls,meshes):
+        #meshes - list of (name,parseObj result)
+        arrays={}
+        offsets={}
+        for field in FIELDS:
+            parts=[mesh[field] for name,mesh in meshes]
+            offsets[field]=np.cumsum([0]+[len(part) for part in parts]).astype(np.int64)
+            if parts:
+                arrays[field]=np.concatenate(parts)
+            else:
+                arrays[field]=np.zeros((0,FLOAT_FIELDS[field]) if field in FLOAT_FIELDS else 0,
+                    dtype=np.float32 if field in FLOAT_FIELDS else np.int32)
+        return cls([name for name,mesh in meshes],arrays,offsets,[list(mesh["materials"]) for name,mesh in meshes])
+
+    def __contains__(self,name):
+        return name in self.lookup
+
+    def get(self,name):
+        i=self.lookup[name]
+        geometry=dict((field,self.arrays[field][self.offsets[field][i]:self.offsets[field][i+1]]) for field in FIELDS)
+        geometry["materials"]=self.materials[i]
+        return geometry
@@ -0,0 +1,101 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+"""
+Instrumentation of a generation run
+    Recorder - collects stage spans, counters, keyed counters and observed values
+    NullRecorder - same methods doing nothing, the default of every LayoutGenerator
+
+Counters are totals ("collisionChecks"), keyed counters split a total by a key
+("rejections" by "preset/rotation") and observations keep every value ("candidatesPerBlock")
+and are summarised on export. Batches are counted with one call, never once per candidate.
+
+toDict/writeJson give the plain summary, chromeTrace/writeChromeTrace the trace event format
+read by chrome://tracing and Perfetto: one span per stage plus the counters at its end.
+"""
+
+class NullRecorder(object):
+    enabled=False
+
+    @contextmanager
+    def stage(self,name):
+        yield
+
+    def count(self,name,amount=1):
+        pass
+
+    def countKey(self,name,key,amount=1):
+        pass
+
+    def observe(self,name,value):
+        pass
+
+NULL_RECORDER=NullRecorder()
+
+
+class Recorder(object):
+    enabled=True
+
+    def __init__(self):
+        self.start=time.perf_counter()
+        self.spans=[] #[name, start, duration] in seconds from the recorder start
+        self.counters={}
+        self.keyedCounters={} #name - {key:amount}
+        self.observations={} #name - [value]
+        self.marks=[] #[stage, time, counters] taken at the end of each stage
+
+    @contextmanager
+    def stage(self,name):
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            end=time.perf_counter()
+            self.spans.append([name,start-self.start,end-start])
+            self.marks.append([name,end-self.start,dict(self.counters)])
+
+    def count(self,name,amount=1):
+        self.counters[name]=self.counters.get(name,0)+amount
+
+    def countKey(self,name,key,amount=1):
+        counts=self.keyedCounters.setdefault(name,{})
+        counts[key]=counts.get(key,0)+amount
+
+    def observe(self,name,value):
+        self.observations.setdefault(name,[]).append(value)
+
+    def summary(self,values):
+        return {"count":len(values),
+            "total":sum(values),
+            "min":min(values),
+            "max":max(values),
+            "mean":float(sum(values))/len(values)}
+
+    def toDict(self):
+        return {"stages":dict((name,duration) for name,start,duration in self.spans),
+            "counters":dict(self.counters),
+            "keyedCounters":dict((name,dict(counts)) for name,counts in self.keyedCounters.items()),
+            "observations":dict((name,self.summary(values)) for name,values in self.observations.items() if values)}
+
+    def chromeTrace(self):
+        pid=os.getpid()
+        events=[]
+        for name,start,duration in self.spans:
+            events.append({"name":name,"cat":"stage","ph":"X","pid":pid,"tid":0,
+                "ts":start*1e6,"dur":duration*1e6})
+        for name,end,counters in self.marks:
+            if counters:
+                events.append({"name":"counters","cat":"counters","ph":"C","pid":pid,"tid":0,
+                    "ts":end*1e6,"args":counters})
+        return {"traceEvents":events,"displayTimeUnit":"ms"}
+
+    def writeJson(self,path):
+        with open(path,"w") as fileHandle:
+            json.dump(self.toDict(),fileHandle,indent=1,sort_keys=True)
+
+    def writeChromeTrace(self,path):
+        with open(path,"w") as fileHandle:
+            json.dump(self.chromeTrace(),fileHandle)
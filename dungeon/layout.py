@@ -0,0 +1,611 @@
+import random
+import time
+
+import numpy as np
+
+from .collision import CollisionWorld, boxesOverlapMany
+from .connectors import ConnectorIndex
+from .control import RunControl
+from .frontier import Frontier
+from .instrumentation import NULL_RECORDER
+from .meshcollision import MeshWorld
+from .presets import ROTATIONS, rotationIndex
+from .sampling import ShuffledRange
+from .snapshots import STAGES, stageKeys, stageRandom
+from .store import ArrayBuffer, SpawnStore
+
+
+"""
+Layout - a generated temple as plain data
+    blocks - placed Block records (preset, rotation, translation, connectors)
+    pillars - Placement records, one per pillar segment
+    props - Placement records, one per decoration prop
+
+LayoutGenerator runs the same stages as the Maya generator (roots, appendBlocks,
+stairMaking, pillarMaking, propMaking) on the dungeon_resources catalog only;
+the same seed always produces the same layout. Each stage draws from its own stream and,
+given a StageCache, the generator resumes after the last stage whose inputs did not change.
+A Recorder (instrumentation) collects stage spans and counters, nothing is printed.
+generate takes a time budget, a CancelToken and a progress callback (control); a stopped
+run returns the layout so far with interrupted set to the stage it stopped in.
+With meshCollision on, blocks are tested against each other with the triangles of their OBJ
+(meshcollision) instead of their size boxes.
+"""
+
+STAIR_OFFSETS=[(5,-5,0),(-5,-5,0),(0,-5,5),(0,-5,-5)] #from the upper connector down to the output a stair starts on
+CANDIDATE_BATCH=512 #placement candidates checked per vectorized collision pass
+MESH_CANDIDATE_BATCH=16 #the same with meshCollision, where testing past the first free candidate costs more
+PILLAR_SEGMENTS=9 #most segments under one anchor
+PILLAR_FLOOR=-20 #no segment starts below this height
+
+
+class Connector(object):
+    __slots__=("block","index","position")
+
+    def __init__(self,block,index):
+        self.block=block
+        self.index=index #position in the preset's connector list
+        self.position=None
+
+
+class Placement(object):
+    #a pillar segment or a prop - props are never rotated
+    __slots__=("preset","tag","translation","box")
+
+    def __init__(self,preset,tag,translation,box):
+        self.preset=preset
+        self.tag=tag
+        self.translation=translation
+        self.box=box
+
+    def toDict(self):
+        return {"preset":self.preset,"tag":self.tag,"translation":list(self.translation)}
+
+
+class Block(object):
+    __slots__=("index","preset","tag","rotations","rotation","translation","box","inputs","outputs")
+
+    def __init__(self,preset,tag,rotations):
+        self.index=None #set once the block is part of the layout
+        self.preset=preset
+        self.tag=tag
+        self.rotations=rotations #PresetRotations of the preset
+        self.rotation=0
+        self.translation=(0,0,0)
+        self.box=None
+        self.inputs=[Connector(self,i) for i in range(rotations.inputs.shape[1])]
+        self.outputs=[Connector(self,i) for i in range(rotations.outputs.shape[1])]
+        self.place(0,(0,0,0))
+
+    def place(self,rotation,translation):
+        index=rotationIndex(rotation)
+        translation=np.asarray(translation,dtype=float)
+        self.rotation=ROTATIONS[index]
+        self.translation=tuple(translation.tolist())
+        for conn,position in zip(self.inputs,(self.rotations.inputs[index]+translation).tolist()):
+            conn.position=tuple(position)
+        for conn,position in zip(self.outputs,(self.rotations.outputs[index]+translation).tolist()):
+            conn.position=tuple(position)
+        self.box=tuple((self.rotations.boxes[index]+np.tile(translation,2)).tolist())
+
+    def toDict(self):
+        return {"index":self.index,
+            "preset":self.preset,
+            "tag":self.tag,
+            "rotation":self.rotation,
+            "translation":list(self.translation),
+            "inputs":[list(conn.position) for conn in self.inputs],
+            "outputs":[list(conn.position) for conn in self.outputs]}
+
+
+class Layout(object):
+    def __init__(self,seed=None,parameters=None):
+        self.seed=seed
+        self.parameters=parameters or {}
+        self.interrupted=None #stage a budget or cancel stopped the generation in
+        self.blocks=[]
+        self.pillars=[]
+        self.props=[]
+
+    def toDict(self):
+        return {"seed":self.seed,
+            "parameters":self.parameters,
+            "interrupted":self.interrupted,
+            "blocks":[block.toDict() for block in self.blocks],
+            "pillars":[pillar.toDict() for pillar in self.pillars],
+            "props":[prop.toDict() for prop in self.props]}
+
+#---------------------------------------------------------------------------------------
+class LayoutGenerator(object):
+    def __init__(self,dungeonBlocksData,terrain,seed=None,cache=None,recorder=None):
+        self.dungeonBlocksData=dungeonBlocksData
+        self.terrain=terrain
+        self.seed=seed
+        self.streamSeed=seed if seed is not None else random.getrandbits(64)
+        self.random=stageRandom(self.streamSeed,"roots") #replaced by the stream of each stage
+        self.cache=cache #StageCache, None never snapshots
+        self.recorder=recorder or NULL_RECORDER
+        self.control=RunControl() #replaced by the budget/cancel/progress of each generate
+        self.currentStage=None
+
+        #Constants
+        self.blockList=[]
+        self.openInputs=ConnectorIndex()
+        self.openOutputs=ConnectorIndex()
+        self.frontier=Frontier(staticBits=self.staticBits) #open outputs blocks grow from, with the candidates that failed
+        self.presetsByTag={} #tag - {preset id:inputs} of the presets it can spawn
+        self.pillarAnchors=ArrayBuffer((3,)) #world position of every pillar anchor
+        self.propSpawns=SpawnStore() #prop spawn points of the placed blocks
+        self.collisionWorld=CollisionWorld(terrain)
+        self.layout=None
+        self.timings={} #stage - seconds
+        self.resumedFrom=None #stage the last generate started after, None from scratch
+        self.failures={} #tag - blocks that found no place
+
+        #Editable
+        self.baseAmount=15
+        self.structureAmount=15
+        self.distanceAmount=200
+        self.rootsAmount=1.0
+        self.maxFailures=50 #consecutive failed blocks before a stage gives up
+        self.center=(0.0,0.0) #x,z the root chances fall off from
+        self.propSpacing={} #prop tag - least distance between two props of it, e.g. {"tree":15}
+        self.meshCollision=False #blocks collide with their triangles, their size box is only the broad phase
+
+    def parameters(self):
+        return {"baseAmount":self.baseAmount,
+            "structureAmount":self.structureAmount,
+            "distanceAmount":self.distanceAmount,
+            "rootsAmount":self.rootsAmount,
+            "propSpacing":dict(self.propSpacing),
+            "meshCollision":self.meshCollision}
+
+    def sampler(self,kind,tag=None):
+        sampler=self.dungeonBlocksData["samplers"].get((kind,tag))
+        if sampler is None:
+            raise ValueError("There is no "+kind+" preset tagged "+str(tag))
+        return sampler
+
+    def spawnPreset(self,kind,tag=None):
+        return self.sampler(kind,tag).sample(self.random)
+
+    def spawnBlock(self,tag=None):
+        blockPreset=self.spawnPreset("rooms",tag)
+        return Block(blockPreset,tag,self.dungeonBlocksData["rotations"+blockPreset])
+
+    def addBlock(self,block):
+        block.index=len(self.layout.blocks)
+        self.layout.blocks.append(block)
+        self.blockList.append(block)
+        for conn in block.inputs:
+            self.openInputs.add(conn)
+        for conn in block.outputs:
+            self.openOutputs.add(conn)
+            self.frontier.add(conn,self.outputClass(conn))
+        self.recorder.count("connectorsOpened",len(block.inputs)+len(block.outputs))
+        self.recorder.countKey("blocksPlaced",block.tag)
+        self.collisionWorld.add(block.box,self.blockShape(block.preset,rotationIndex(block.rotation),block.translation))
+        index=rotationIndex(block.rotation)
+        self.pillarAnchors.extend(block.rotations.pillars[index]+block.translation)
+        self.propSpawns.extend(block.rotations.propTagIds,block.rotations.propChances,block.rotations.props[index]+block.translation)
+
+    def closeConnector(self,conn):
+        if conn in self.openInputs or conn in self.openOutputs:
+            self.recorder.count("connectorsClosed")
+        self.openInputs.remove(conn)
+        self.openOutputs.remove(conn)
+        self.frontier.remove(conn)
+
+    def tagPresets(self,tag):
+        #presets an output has to fail for before it is retired for the tag
+        if tag not in self.presetsByTag:
+            sampler=self.dungeonBlocksData["samplers"][("rooms",tag)]
+            tables=[self.dungeonBlocksData["rotations"+preset] for preset in sampler.choices
+                if self.dungeonBlocksData["rooms"+preset]["freq"]>0]
+            self.presetsByTag[tag]=dict((table.id,table.inputs.shape[1]) for table in tables if table.inputs.shape[1])
+        return self.presetsByTag[tag]
+
+    def outputClass(self,conn):
+        return self.dungeonBlocksData["compatibility"].classOf(conn.block.rotations.id,
+            rotationIndex(conn.block.rotation),conn.index)
+
+    def staticBits(self,presetId):
+        #candidates of a preset the block of their output rules out (compatibility), None with
+        #meshCollision where an overlapping box does not mean a collision
+        if self.meshCollision:
+            return None
+        return self.dungeonBlocksData["compatibility"].bits(presetId)
+
+    def blockShape(self,preset,rotations,translations):
+        #mesh collision shape of a block preset, None when blocks collide as boxes
+        if not self.meshCollision:
+            return None
+        if self.collisionWorld.meshes is None:
+            self.collisionWorld.meshes=MeshWorld(self.dungeonBlocksData["geometry"])
+        return ("rooms/"+preset,rotations,translations)
+
+    def detectCollision(self,box,shape=None):
+        self.recorder.count("collisionChecks")
+        return self.collisionWorld.collides(box,shape)
+
+    def rootChances(self):
+        #chance of every terrain vertex to hold a root block, 0 outside distanceAmount and where
+        #no base preset fits inside the regions, generateRoots would draw roots there forever
+        vertices=self.terrain.vertices
+        distance=np.sqrt((vertices[:,0]-self.center[0])**2 + (vertices[:,2]-self.center[1])**2)
+        chance=vertices[:,1]/100.0 *0.05 #encourage higher places
+        chance*=1 - distance/500 #encourage closer to center
+        chance*=self.rootsAmount
+        chance=np.where(distance<=self.distanceAmount,chance,0)
+        if self.collisionWorld.regions is not None:
+            sampler=self.sampler("rooms","base")
+            translations=np.tile(10*np.floor(vertices/10),2)
+            fits=np.zeros(len(vertices),dtype=bool)
+            for preset,weight in zip(sampler.choices,np.diff(np.concatenate([[0],sampler.cumulativeArray]))):
+                if weight>0:
+                    fits|=self.collisionWorld.insideRegions(self.dungeonBlocksData["rotations"+preset].boxes[0]+translations)
+            chance=np.where(fits,chance,0)
+        return chance
+
+    def generateRoots(self):
+        vertices=self.terrain.vertices
+        chance=self.rootChances()
+        if not (chance>0).any():
+            raise ValueError("The terrain has no position where a root block may spawn")
+
+        while not self.blockList and not self.control.shouldStop():
+            #one draw per vertex, taken from the seeded stream in a single call
+            draws=np.random.default_rng(self.random.getrandbits(64)).random(len(vertices))
+            translations=(10*np.floor(vertices[chance>draws]/10)).astype(np.int64)
+            for translation in translations.tolist():
+                block=self.spawnBlock("base")
+                block.place(0,tuple(translation))
+                if self.collisionWorld.regions is not None and not self.collisionWorld.insideRegions(block.box)[0]:
+                    continue
+                self.addBlock(block)
+                self.control.report(self.currentStage,len(self.blockList),None)
+
+    def appendBlocks(self,amount=30,tag=None):
+        failures=0
+        total=amount
+        while amount>0 and failures<self.maxFailures and not self.control.shouldStop():
+            block=self.spawnBlock(tag)
+            localConnectors=block.inputs+block.outputs
+
+            worked=False
+            tries=0
+            rotationAmount=self.random.choice(ROTATIONS)
+
+            #Find Input - Output Combo - every (open output the tag has not retired, input) pair in
+            #a random order, read from a shuffled range of pair numbers one batch at a time; each
+            #pair is tried in all four rotations, starting a quarter turn after rotationAmount
+            order=np.array([rotationIndex(rotationAmount+90*(turn+1)) for turn in range(4)])
+            inputs=len(block.inputs)
+            retired=self.frontier.retiredTable(tag)
+            openIds=self.frontier.openIds()
+            openIds=openIds[~retired[openIds]]
+            pairs=ShuffledRange(len(openIds)*inputs,np.random.default_rng(self.random.getrandbits(64)))
+            batchSize=(MESH_CANDIDATE_BATCH if self.meshCollision else CANDIDATE_BATCH)//4
+            for start in range(0,len(pairs),batchSize):
+                batch=pairs.take(start,start+batchSize)
+                ids=np.repeat(openIds[batch//inputs],4)
+                inputIndices=np.repeat(batch%inputs,4)
+                rotations=np.tile(order,len(batch))
+
+                #Skip the candidates that failed before
+                live=np.flatnonzero(~retired[ids] & ~self.frontier.isDead(block.rotations.id,inputs,ids,inputIndices,rotations))
+                self.recorder.count("candidatesSkipped",len(ids)-len(live))
+                if not len(live):
+                    continue
+                ids,inputIndices,rotations=ids[live],inputIndices[live],rotations[live]
+
+                #Move - the input has to land on the output
+                translations=self.frontier.positions[ids]-block.rotations.inputs[rotations,inputIndices]
+                boxes=block.rotations.boxes[rotations]+np.tile(translations,2)
+
+                #Detect Collision - all candidates at once, the colliding ones stay dead
+                collides=self.collisionWorld.collidesMany(boxes,self.blockShape(block.preset,rotations,translations))
+                free=np.flatnonzero(~collides)
+                if collides.any():
+                    retiredNow=self.frontier.markDead(block.rotations.id,inputs,ids[collides],inputIndices[collides],
+                        rotations[collides],self.tagPresets(tag),tag)
+                    self.recorder.count("outputsRetired",retiredNow)
+                tested=int(free[0])+1 if len(free) else len(boxes)
+                tries+=tested
+                if self.recorder.enabled:
+                    self.recorder.count("collisionChecks",len(boxes))
+                    rejected=np.bincount(rotations[:free[0] if len(free) else len(boxes)],minlength=4)
+                    for index in np.flatnonzero(rejected):
+                        self.recorder.countKey("rejections",block.preset+"/"+str(ROTATIONS[index]),int(rejected[index]))
+                if len(free):
+                    candidate=free[0]
+                    input=block.inputs[inputIndices[candidate]]
+                    output=self.frontier.connectors[ids[candidate]]
+                    block.place(ROTATIONS[rotations[candidate]],translations[candidate])
+                    worked=True
+                    break
+
+            if worked:
+                #Add the block
+                self.addBlock(block)
+                amount-=1
+                failures=0
+
+                self.recorder.observe("candidatesPerBlock",tries)
+                self.control.report(self.currentStage,total-amount,total)
+
+                #Remove used inputs
+                self.closeConnector(input)
+                self.closeConnector(output)
+
+                #Remove all other coinciding inputs/outputs
+                to_remove=[]
+                for conn in localConnectors:
+                    for conn2 in self.openInputs.at(conn.position) + self.openOutputs.at(conn.position):
+                        if conn2.block is not block:
+                            to_remove.append(conn)
+                            to_remove.append(conn2)
+                for conn in to_remove:
+                    self.closeConnector(conn)
+            else:
+                failures+=1
+                self.failures[tag]=self.failures.get(tag,0)+1
+                self.recorder.countKey("blocksFailed",block.preset)
+                self.recorder.observe("candidatesPerFailure",tries)
+
+    def stairMaking(self,amount=4):
+        placed=0
+
+        for conn2 in list(self.openInputs) + list(self.openOutputs):
+            #only outputs 5 units lower and 5 units to a side can carry a stair
+            for conn in self.openOutputs.near(conn2.position,STAIR_OFFSETS):
+                if placed>=amount or self.control.shouldStop():
+                    return
+
+                pos1=conn.position
+                pos2=conn2.position
+                if conn.block is not conn2.block:
+                    block=self.spawnBlock(tag="stairs")
+
+                    angle=None
+                    if pos1[2]-pos2[2]==5:
+                        angle=180
+                    elif pos1[2]-pos2[2]==-5:
+                        angle=0
+                    elif pos1[0]-pos2[0]==5:
+                        angle=270
+                    else:
+                        angle=90
+
+                    #Skip the stairs the block of the output rules out
+                    self.recorder.count("stairsAttempted")
+                    outputId=self.frontier.ids.get(conn) #tiles drop outputs outside their region from the frontier
+                    if outputId is not None and self.frontier.isDead(block.rotations.id,len(block.inputs),outputId,0,rotationIndex(angle)):
+                        self.recorder.count("candidatesSkipped")
+                        self.failures["stairs"]=self.failures.get("stairs",0)+1
+                        continue
+
+                    #Move
+                    block.place(angle,np.asarray(pos1,dtype=float)-block.rotations.inputs[rotationIndex(angle)][0])
+
+                    #Detect Collision
+                    if not self.detectCollision(block.box,self.blockShape(block.preset,rotationIndex(angle),block.translation)):
+                        self.addBlock(block)
+                        placed+=1
+                        self.control.report(self.currentStage,placed,amount)
+                    else:
+                        self.failures["stairs"]=self.failures.get("stairs",0)+1
+
+    def pillarMaking(self):
+        #every anchor gets a column of segments 10 units apart going down; one collision query
+        #for all segments gives the free depth of each column, earlier columns then cut the ones
+        #they overlap, like spawning and testing the segments one by one would
+        if not len(self.pillarAnchors):
+            return
+        anchors=self.pillarAnchors.view()
+        sampler=self.sampler("props","pillar")
+        sizes=np.array([[self.dungeonBlocksData["props"+preset].get(axis,1) for axis in ("size_x","size_y","size_z")]
+            for preset in sampler.choices],dtype=float)*10
+
+        #Segments - (anchors,PILLAR_SEGMENTS) presets and boxes
+        draws=np.random.default_rng(self.random.getrandbits(64)).random(len(anchors)*PILLAR_SEGMENTS)
+        presets=sampler.indicesMany(draws).reshape(len(anchors),PILLAR_SEGMENTS)
+        low=np.repeat(anchors[:,None,:]-(5,0,5),PILLAR_SEGMENTS,axis=1)
+        low[:,:,1]=anchors[:,None,1]-10*np.arange(1,PILLAR_SEGMENTS+1)
+        boxes=np.concatenate([low,low+sizes[presets]],axis=2)
+
+        #Free depth against the blocks and the bedrock
+        valid=low[:,:,1]>=PILLAR_FLOOR
+        blocked=~valid
+        blocked[valid]=self.collisionWorld.collidesMany(boxes[valid])
+        depths=np.where(blocked.any(axis=1),blocked.argmax(axis=1),PILLAR_SEGMENTS)
+        self.recorder.count("collisionChecks",int(valid.sum()))
+        self.recorder.count("pillarsAttempted",int(np.minimum(depths+1,valid.sum(axis=1)).sum()))
+
+        #Earlier columns closer than a segment's width cut the later ones
+        reach=int(np.ceil(sizes[:,[0,2]].max()/10))
+        cells=np.floor(anchors[:,[0,2]]/10).astype(np.int64).tolist()
+        columns={} #cell - anchors already placed in it
+        for index in range(len(anchors)):
+            if self.control.shouldStop():
+                return
+            self.control.report(self.currentStage,index,len(anchors))
+            depth=int(depths[index])
+            for dx in range(-reach,reach+1):
+                for dz in range(-reach,reach+1):
+                    for other in columns.get((cells[index][0]+dx,cells[index][1]+dz),()):
+                        if depth and depths[other]:
+                            hits=boxesOverlapMany(boxes[index,:depth],boxes[other,:depths[other]]).any(axis=1)
+                            if hits.any():
+                                depth=int(hits.argmax())
+            depths[index]=depth
+            columns.setdefault(tuple(cells[index]),[]).append(index)
+
+            #Emit the column
+            for segment in range(depth):
+                box=tuple(boxes[index,segment].tolist())
+                self.collisionWorld.add(box)
+                self.layout.pillars.append(Placement(sampler.choices[presets[index,segment]],"pillar",box[:3],box))
+            self.recorder.count("pillarsKept",depth)
+
+    def propSizes(self,sampler):
+        #(presets,3) box size of every preset of a props sampler
+        return np.array([[self.dungeonBlocksData["props"+preset].get(axis,1) for axis in ("size_x","size_y","size_z")]
+            for preset in sampler.choices],dtype=float)*10
+
+    def spaceProps(self,positions,spacing):
+        #Poisson-disk style thinning - a prop is dropped when an earlier kept one is closer than spacing
+        if not spacing>0:
+            raise ValueError("Prop spacing has to be above 0, got "+str(spacing))
+        kept=np.zeros(len(positions),dtype=bool)
+        cells={}
+        keys=np.floor(positions[:,[0,2]]/spacing).astype(np.int64).tolist()
+        for index,(cellX,cellZ) in enumerate(keys):
+            near=[other for dx in (-1,0,1) for dz in (-1,0,1) for other in cells.get((cellX+dx,cellZ+dz),())]
+            if near and (np.sum((positions[near]-positions[index])**2,axis=1)<spacing**2).any():
+                continue
+            kept[index]=True
+            cells.setdefault((cellX,cellZ),[]).append(index)
+        return kept
+
+    def propMaking(self):
+        if not len(self.propSpawns) or self.control.shouldStop():
+            return
+        tags=self.propSpawns.tags.view()
+        chances=self.propSpawns.chances.view()
+        positions=self.propSpawns.positions.view()
+        tagNames=self.dungeonBlocksData["propTags"].names
+
+        #Chance rolls - one draw per spawn point, then one preset draw per prop of a tag
+        rng=np.random.default_rng(self.random.getrandbits(64))
+        spawned=np.flatnonzero(chances>=rng.random(len(chances)))
+        self.recorder.count("propsAttempted",len(spawned))
+        accepted=[]
+        for tagId in sorted(set(tags[spawned].tolist()),key=tagNames.__getitem__):
+            if self.control.shouldStop(): #the tags done so far are still emitted
+                break
+            tag=tagNames[tagId]
+            members=spawned[tags[spawned]==tagId]
+            sampler=self.sampler("props",tag)
+            presets=sampler.indicesMany(rng.random(len(members)))
+            low=positions[members]-(5,0,5)
+            boxes=np.concatenate([low,low+self.propSizes(sampler)[presets]],axis=1)
+
+            #Collision with the blocks, pillars and bedrock in one query
+            free=~self.collisionWorld.collidesMany(boxes)
+            self.recorder.count("collisionChecks",len(boxes))
+            if tag in self.propSpacing:
+                spaced=np.zeros(len(members),dtype=bool)
+                spaced[free]=self.spaceProps(positions[members[free]],self.propSpacing[tag])
+                self.recorder.count("propsSpaced",int(free.sum()-spaced.sum()))
+                free=spaced
+            for index in np.flatnonzero(free):
+                box=tuple(boxes[index].tolist())
+                accepted.append((members[index],Placement(sampler.choices[presets[index]],tag,box[:3],box)))
+        self.control.report(self.currentStage,len(self.propSpawns),len(self.propSpawns))
+
+        #Emit in spawn point order; props do not block each other, they only take their space once all are placed
+        accepted.sort(key=lambda entry:entry[0])
+        self.layout.props.extend(placement for index,placement in accepted)
+        self.recorder.count("propsKept",len(accepted))
+        for index,prop in accepted:
+            self.collisionWorld.add(prop.box)
+
+    #Snapshots
+    def snapshot(self):
+        #the state after a stage as plain data, see restore
+        def connectors(index):
+            return [(conn.block.index,conn in conn.block.inputs,conn.index) for conn in index]
+        def placements(placements):
+            return [(placement.preset,placement.tag,placement.translation,placement.box) for placement in placements]
+        return {"blocks":[(block.preset,block.tag,block.rotation,block.translation) for block in self.layout.blocks],
+            "openInputs":connectors(self.openInputs),
+            "openOutputs":connectors(self.openOutputs),
+            "pillars":placements(self.layout.pillars),
+            "props":placements(self.layout.props),
+            "failures":dict(self.failures)}
+
+    def restore(self,snapshot):
+        #restored blocks were counted by the run that made the snapshot
+        recorder,self.recorder=self.recorder,NULL_RECORDER
+        for preset,tag,rotation,translation in snapshot["blocks"]:
+            block=Block(preset,tag,self.dungeonBlocksData["rotations"+preset])
+            block.place(rotation,translation)
+            self.addBlock(block)
+
+        #addBlock opened every connector, keep only the open ones in their order
+        self.openInputs=ConnectorIndex()
+        self.openOutputs=ConnectorIndex()
+        self.frontier=Frontier(staticBits=self.staticBits)
+        for target,connectors in ((self.openInputs,snapshot["openInputs"]),(self.openOutputs,snapshot["openOutputs"])):
+            for blockIndex,isInput,index in connectors:
+                block=self.layout.blocks[blockIndex]
+                target.add((block.inputs if isInput else block.outputs)[index])
+                if not isInput:
+                    self.frontier.add(block.outputs[index],self.outputClass(block.outputs[index]))
+
+        self.layout.pillars=[Placement(*pillar) for pillar in snapshot["pillars"]]
+        self.layout.props=[Placement(*prop) for prop in snapshot["props"]]
+        for placement in self.layout.pillars+self.layout.props:
+            self.collisionWorld.add(placement.box)
+        self.failures=dict(snapshot["failures"])
+        self.recorder=recorder
+
+    def stageKeys(self):
+        regions=self.collisionWorld.regions
+        parameters=dict(self.parameters(),maxFailures=self.maxFailures,propSpacing=tuple(sorted(self.propSpacing.items())),
+            center=tuple(self.center),regions=None if regions is None else tuple(map(tuple,regions)))
+        return stageKeys(self.seed,parameters,self.dungeonBlocksData["fingerprints"],self.terrain.fingerprint)
+
+    def runStage(self,name,stage,*args,**kwargs):
+        self.random=stageRandom(self.streamSeed,name)
+        self.currentStage=name
+        self.control.report(name,0,None)
+        start=time.perf_counter()
+        with self.recorder.stage(name):
+            stage(*args,**kwargs)
+        self.timings[name]=time.perf_counter()-start
+        self.control.report(name,None,None)
+
+    def stages(self):
+        return {"roots":(self.generateRoots,{}),
+            "base":(self.appendBlocks,{"amount":self.baseAmount,"tag":"base"}),
+            "infrastructure":(self.appendBlocks,{"amount":self.structureAmount,"tag":"infrastructure"}),
+            "stairs":(self.stairMaking,{"amount":self.structureAmount/2}),
+            "pillars":(self.pillarMaking,{}),
+            "props":(self.propMaking,{})}
+
+    def generate(self,budget=None,cancelToken=None,progress=None):
+        #budget - seconds, cancelToken - CancelToken, progress - progress(stage,done,total), see control
+        self.control=RunControl(budget,cancelToken,progress)
+        self.layout=Layout(self.seed,self.parameters())
+        stages=self.stages()
+        keys=self.stageKeys() if self.cache is not None and self.seed is not None else None
+
+        #Resume after the latest cached stage
+        first=0
+        if keys is not None:
+            for position in range(len(keys)-1,-1,-1):
+                snapshot=self.cache.get(keys[position][1])
+                if snapshot is not None:
+                    self.restore(snapshot)
+                    self.resumedFrom=keys[position][0]
+                    first=position+1
+                    break
+
+        for position in range(first,len(STAGES)):
+            name=STAGES[position][0]
+            stage,kwargs=stages[name]
+            if self.control.shouldStop():
+                self.layout.interrupted=name
+                break
+            self.runStage(name,stage,**kwargs)
+            if self.control.stopReason is not None:
+                #only a stage that saw the stop returned early, one that ran out of budget just as
+                #it finished is complete; an interrupted stage is not what the seed gives, it is never cached
+                self.layout.interrupted=name
+                break
+            if keys is not None:
+                self.cache.put(keys[position][1],self.snapshot())
+
+        return self.layout
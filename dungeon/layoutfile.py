@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from .catalog import CACHE_VERSION
+from .layout import Block, Layout, Placement
+from .presets import ROTATIONS, rotationIndex
+
+
+"""
+Layout files - a generated temple as arrays plus a JSON sidecar
+
+    temple.npz - per section (blocks, pillars, props)
+        <section>Preset - int32 index into the preset names of the section
+        <section>Tag - int16 index into the tag names of the section
+        <section>Rotation - uint8 rotation index (0..3 for 0,90,180,270), 0 for props
+        <section>Translation - (n,3) float32
+    temple.json - format, catalog version and fingerprints, seed, parameters, interrupted,
+                  preset and tag names of every section, placement counts
+
+The sidecar is readable on its own, so temples can be listed and compared without numpy.
+Connector positions and boxes are not stored, they come back from the catalog on load.
+
+    python -m dungeon.layoutfile info temple
+    python -m dungeon.layoutfile diff old new
+"""
+
+FORMAT_VERSION=1
+SECTIONS=["blocks","pillars","props"]
+
+def layoutPaths(path):
+    #"temple", "temple.npz" and "temple.json" all name the same pair of files
+    base,extension=os.path.splitext(path)
+    if extension not in (".npz",".json"):
+        base=path
+    return base+".npz",base+".json"
+
+def catalogVersion(dungeonBlocksData):
+    return {"version":CACHE_VERSION,"fingerprints":dungeonBlocksData["fingerprints"]}
+
+def interned(values):
+    #names - index of every value into names, in first seen order
+    names=[]
+    lookup={}
+    indices=[]
+    for value in values:
+        if value not in lookup:
+            lookup[value]=len(names)
+            names.append(value)
+        indices.append(lookup[value])
+    return names,indices
+
+def saveLayout(path,layout,dungeonBlocksData):
+    arrayPath,headerPath=layoutPaths(path)
+    header={"format":FORMAT_VERSION,
+        "catalog":catalogVersion(dungeonBlocksData),
+        "seed":layout.seed,
+        "parameters":layout.parameters,
+        "interrupted":layout.interrupted,
+        "presets":{},
+        "tags":{},
+        "counts":{}}
+    arrays={}
+    for section in SECTIONS:
+        placements=getattr(layout,section)
+        presets,presetIndices=interned([placement.preset for placement in placements])
+        tags,tagIndices=interned([placement.tag for placement in placements])
+        header["presets"][section]=presets
+        header["tags"][section]=tags
+        header["counts"][section]=len(placements)
+        arrays[section+"Preset"]=np.array(presetIndices,dtype=np.int32)
+        arrays[section+"Tag"]=np.array(tagIndices,dtype=np.int16)
+        arrays[section+"Rotation"]=np.array([rotationIndex(getattr(placement,"rotation",0)) for placement in placements],dtype=np.uint8)
+        arrays[section+"Translation"]=np.array([placement.translation for placement in placements],dtype=np.float32).reshape(-1,3)
+
+    with open(arrayPath,"wb") as fileHandle:
+        np.savez_compressed(fileHandle,**arrays)
+    with open(headerPath,"w") as fileHandle:
+        json.dump(header,fileHandle,indent=1,sort_keys=True)
+
+def readHeader(path):
+    with open(layoutPaths(path)[1],"r") as fileHandle:
+        header=json.load(fileHandle)
+    if header.get("format")!=FORMAT_VERSION:
+        raise ValueError(path+" is not a layout file of format "+str(FORMAT_VERSION))
+    return header
+
+def readLayout(path):
+    header=readHeader(path)
+    with np.load(layoutPaths(path)[0],allow_pickle=False) as fileHandle:
+        arrays=dict((name,fileHandle[name]) for name in fileHandle.files)
+    return header,arrays
+
+def placements(header,arrays,section):
+    #(preset, tag, rotation in degrees, translation) of every placement of a section
+    presets=header["presets"][section]
+    tags=header["tags"][section]
+    return [(presets[preset],tags[tag],ROTATIONS[rotation],tuple(translation)) for preset,tag,rotation,translation in
+        zip(arrays[section+"Preset"].tolist(),arrays[section+"Tag"].tolist(),
+            arrays[section+"Rotation"].tolist(),arrays[section+"Translation"].tolist())]
+
+def layoutFromFile(header,arrays,dungeonBlocksData):
+    #full Layout records, connectors and boxes are taken from the catalog
+    layout=Layout(header["seed"],header["parameters"])
+    layout.interrupted=header["interrupted"]
+    for preset,tag,rotation,translation in placements(header,arrays,"blocks"):
+        if "rotations"+preset not in dungeonBlocksData:
+            raise ValueError("The catalog has no block preset "+preset)
+        block=Block(preset,tag,dungeonBlocksData["rotations"+preset])
+        block.place(rotation,translation)
+        block.index=len(layout.blocks)
+        layout.blocks.append(block)
+    for section in ("pillars","props"):
+        for preset,tag,rotation,translation in placements(header,arrays,section):
+            if "props"+preset not in dungeonBlocksData:
+                raise ValueError("The catalog has no prop preset "+preset)
+            data=dungeonBlocksData["props"+preset]
+            size=(data.get("size_x",1)*10,data.get("size_y",1)*10,data.get("size_z",1)*10)
+            box=translation+tuple(translation[axis]+size[axis] for axis in range(3))
+            getattr(layout,section).append(Placement(preset,tag,translation,box))
+    return layout
+
+def loadLayout(path,dungeonBlocksData):
+    header,arrays=readLayout(path)
+    return layoutFromFile(header,arrays,dungeonBlocksData)
+
+def diffLayouts(firstPath,secondPath):
+    #what changed from the first temple to the second, placements compared as (preset, rotation, translation)
+    first,firstArrays=readLayout(firstPath)
+    second,secondArrays=readLayout(secondPath)
+    difference={"seed":[first["seed"],second["seed"]] if first["seed"]!=second["seed"] else None,
+        "parameters":dict((key,[first["parameters"].get(key),second["parameters"].get(key)])
+            for key in set(first["parameters"])|set(second["parameters"])
+            if first["parameters"].get(key)!=second["parameters"].get(key)),
+        "catalogChanged":first["catalog"]!=second["catalog"]}
+    for section in SECTIONS:
+        old=set((preset,rotation,translation) for preset,tag,rotation,translation in placements(first,firstArrays,section))
+        new=set((preset,rotation,translation) for preset,tag,rotation,translation in placements(second,secondArrays,section))
+        difference[section]={"kept":len(old&new),"removed":len(old-new),"added":len(new-old)}
+    return difference
+
+def main(arguments=None):
+    parser=argparse.ArgumentParser(description="Inspect and compare temple layout files.")
+    commands=parser.add_subparsers(dest="command")
+    info=commands.add_parser("info",help="print the sidecar of a layout")
+    info.add_argument("path")
+    diff=commands.add_parser("diff",help="compare two layouts")
+    diff.add_argument("first")
+    diff.add_argument("second")
+    arguments=parser.parse_args(arguments)
+
+    if arguments.command=="info":
+        result=readHeader(arguments.path)
+    elif arguments.command=="diff":
+        result=diffLayouts(arguments.first,arguments.second)
+    else:
+        parser.print_help()
+        return 1
+    sys.stdout.write(json.dumps(result,indent=1,sort_keys=True)+"\n")
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
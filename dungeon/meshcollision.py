@@ -0,0 +1,292 @@
+import numpy as np
+
+from .collision import boxesOverlapMany
+from .geometry import triangulate
+from .presets import ROTATIONS, rotatePoints
+
+
+"""
+Mesh collision - the precise mode, blocks tested with the triangles of their OBJ instead of
+their size box
+    MeshLibrary - a bounding volume hierarchy over the triangles of a preset for each of the
+                  four rotations, built the first time the preset is tested; every tree lives
+                  in one pool of node arrays so many tree pairs are walked in one pass
+    MeshWorld - the placed blocks with their trees; their boxes are the broad phase, only the
+                pairs whose boxes overlap walk tree against tree down to the triangles
+    shape - (preset geometry name, rotation index, translation), arrays of both for many boxes
+
+Two meshes collide when their triangles overlap by more than TOLERANCE along every
+separating axis; faces lying flush against each other only touch, like boxes do. Coplanar
+faces facing the same way are walls of two blocks in the same place and collide as soon as
+they overlap within their plane. A mesh with no triangle crossing the other one collides when
+it lies inside it (encloses), tested by casting rays from points of the inner mesh.
+Pillars, props, the bedrock and regions stay boxes.
+"""
+
+LEAF_SIZE=8 #most triangles in a leaf node
+TOLERANCE=0.05 #overlap a pair of triangles may have and still only touch
+PAIR_BATCH=16384 #triangle pairs gathered per vectorized pass
+ACTIVE_PAIRS=16 #node pairs of a query walked at the same time
+WAVE_PAIRS=4 #triangle pairs of a query in the first wave, every next wave tests twice as many
+ENCLOSED_POINTS=3 #points of the inner mesh that all have to be inside the outer one
+#rays of the enclosure test, skewed off the axes so they do not run along the edges of lattice aligned meshes
+ENCLOSED_RAYS=np.array([[1,0.0213,0.0371],[0.0173,1,0.0297],[0.0331,0.0119,1]])
+
+def meshTriangles(mesh):
+    #(t,3,3) triangles of a parseObj mesh
+    vertices=np.asarray(mesh["vertices"],dtype=float)
+    return vertices[np.asarray(mesh["faceIndices"],dtype=np.int64)[triangulate(mesh["faceCounts"])]]
+
+def trianglesOverlap(first,second):
+    #(n,3,3) and (n,3,3) - (n,) bool, True where no axis separates the pair; the 17 axes are both
+    #normals, the 9 edge cross products and the in-plane edge normals coplanar pairs need.
+    #Coplanar pairs facing the same way are only separated within their plane
+    edgesFirst=np.roll(first,-1,axis=1)-first
+    edgesSecond=np.roll(second,-1,axis=1)-second
+    normalFirst=np.cross(edgesFirst[:,0],edgesFirst[:,1])
+    normalSecond=np.cross(edgesSecond[:,0],edgesSecond[:,1])
+    axes=np.concatenate([normalFirst[:,None],normalSecond[:,None],
+        np.cross(edgesFirst[:,:,None],edgesSecond[:,None,:]).reshape(-1,9,3),
+        np.cross(normalFirst[:,None],edgesFirst),np.cross(normalSecond[:,None],edgesSecond)],axis=1)
+    length=np.linalg.norm(axes,axis=2)
+    usable=length>1e-9 #parallel edges and degenerate triangles give no axis
+    axes/=np.where(usable,length,1)[:,:,None]
+    projectFirst=np.einsum("nav,npv->nap",axes,first)
+    projectSecond=np.einsum("nav,npv->nap",axes,second)
+    separated=((projectFirst.max(axis=2)<=projectSecond.min(axis=2)+TOLERANCE) |
+        (projectSecond.max(axis=2)<=projectFirst.min(axis=2)+TOLERANCE))&usable
+    facing=np.einsum("nv,nv->n",axes[:,0],axes[:,1])
+    distance=np.abs(np.einsum("nv,nv->n",axes[:,0],second[:,0]-first[:,0]))
+    coplanar=usable[:,0]&usable[:,1]&(facing>1-1e-6)&(distance<=TOLERANCE)
+    return np.where(coplanar,~separated[:,11:].any(axis=1),~separated.any(axis=1))
+
+def rayCrossings(points,directions,triangles):
+    #(p,3) points, (r,3) directions, (t,3,3) triangles - (p,r) triangles every ray crosses
+    edgeFirst=triangles[:,1]-triangles[:,0]
+    edgeSecond=triangles[:,2]-triangles[:,0]
+    normal=np.cross(directions[:,None],edgeSecond[None]) #(r,t,3)
+    determinant=np.einsum("rtv,tv->rt",normal,edgeFirst)
+    valid=np.abs(determinant)>1e-12
+    inverse=np.where(valid,1.0/np.where(valid,determinant,1),0)
+    toPoint=points[:,None]-triangles[None,:,0] #(p,t,3)
+    u=np.einsum("ptv,rtv->prt",toPoint,normal)*inverse[None]
+    cross=np.cross(toPoint,edgeFirst[None]) #(p,t,3)
+    v=np.einsum("rv,ptv->prt",directions,cross)*inverse[None]
+    distance=np.einsum("tv,ptv->pt",edgeSecond,cross)[:,None]*inverse[None]
+    return (valid[None]&(u>=0)&(v>=0)&(u+v<=1)&(distance>0)).sum(axis=2)
+
+
+class MeshLibrary(object):
+    def __init__(self,geometry):
+        self.geometry=geometry #GeometryLibrary of the catalog
+        self.trees={} #name - (4,) root node of every rotation
+        self.spans={} #root node - (first triangle,triangle amount) of its tree
+        self.parts=[] #(lower,upper,children,leaves,triangles) of every tree, node and triangle indices local
+        self.lower=np.zeros((0,3)) #node bounds
+        self.upper=np.zeros((0,3))
+        self.size=np.zeros(0) #summed extent of a node, the larger side of a pair is split first
+        self.children=np.zeros((0,2),dtype=np.int64) #-1 for leaves
+        self.leaves=np.zeros((0,LEAF_SIZE),dtype=np.int64) #triangles of a leaf, -1 padded
+        self.triangles=np.zeros((0,3,3))
+        self.triangleLower=np.zeros((0,3))
+        self.triangleUpper=np.zeros((0,3))
+
+    def roots(self,name):
+        if name not in self.trees:
+            if name not in self.geometry:
+                raise ValueError("The catalog has no geometry for "+name)
+            triangles=meshTriangles(self.geometry.get(name))
+            roots=[]
+            for rotation in ROTATIONS:
+                rotated=rotatePoints(triangles.reshape(-1,3),rotation).reshape(-1,3,3)
+                roots.append(self.build(rotated))
+            self.pack()
+            self.trees[name]=np.array(roots,dtype=np.int64)
+        return self.trees[name]
+
+    def build(self,triangles):
+        #median split along the longest axis of the centroids; returns the root node in the pool
+        nodeOffset=sum(len(part[0]) for part in self.parts)
+        triangleOffset=sum(len(part[4]) for part in self.parts)
+        lower,upper,children,leaves=[],[],[],[]
+        centroids=triangles.mean(axis=1)
+        pending=[(np.arange(len(triangles)),None,0)] #triangles, parent, child slot
+        while pending:
+            members,parent,slot=pending.pop()
+            node=len(lower)
+            if parent is not None:
+                children[parent][slot]=nodeOffset+node
+            points=triangles[members].reshape(-1,3)
+            lower.append(points.min(axis=0) if len(points) else np.zeros(3))
+            upper.append(points.max(axis=0) if len(points) else np.zeros(3))
+            children.append([-1,-1])
+            leaves.append([-1]*LEAF_SIZE)
+            if len(members)<=LEAF_SIZE:
+                leaves[node][:len(members)]=(members+triangleOffset).tolist()
+                continue
+            spread=centroids[members]
+            axis=int(np.argmax(spread.max(axis=0)-spread.min(axis=0)))
+            members=members[np.argsort(spread[:,axis],kind="stable")]
+            half=len(members)//2
+            pending.append((members[half:],node,1))
+            pending.append((members[:half],node,0))
+        self.parts.append((np.array(lower),np.array(upper),np.array(children,dtype=np.int64),
+            np.array(leaves,dtype=np.int64),triangles))
+        self.spans[nodeOffset]=(triangleOffset,len(triangles))
+        return nodeOffset
+
+    def pack(self):
+        self.lower=np.concatenate([part[0] for part in self.parts])
+        self.upper=np.concatenate([part[1] for part in self.parts])
+        self.size=(self.upper-self.lower).sum(axis=1)
+        self.children=np.concatenate([part[2] for part in self.parts])
+        self.leaves=np.concatenate([part[3] for part in self.parts])
+        self.triangles=np.concatenate([part[4] for part in self.parts])
+        self.triangleLower=self.triangles.min(axis=1)
+        self.triangleUpper=self.triangles.max(axis=1)
+
+    def leafHits(self,first,second,query,offsets,hit):
+        #marks hit for the queries where a triangle pair of two leaves overlaps, triangle bounds first
+        batch=max(1,PAIR_BATCH//LEAF_SIZE**2)
+        for start in range(0,len(query),batch):
+            part=slice(start,start+batch)
+            trianglesFirst=np.repeat(self.leaves[first[part]],LEAF_SIZE,axis=1).reshape(-1)
+            trianglesSecond=np.tile(self.leaves[second[part]],LEAF_SIZE).reshape(-1)
+            pairQuery=np.repeat(query[part],LEAF_SIZE**2)
+            keep=(trianglesFirst>=0)&(trianglesSecond>=0)&~hit[pairQuery]
+            trianglesFirst,trianglesSecond,pairQuery=trianglesFirst[keep],trianglesSecond[keep],pairQuery[keep]
+            shift=offsets[pairQuery]
+            #touching bounds stay, coplanar faces have no extent along their normal
+            near=np.all((self.triangleLower[trianglesFirst]+shift<=self.triangleUpper[trianglesSecond]+TOLERANCE) &
+                (self.triangleLower[trianglesSecond]<=self.triangleUpper[trianglesFirst]+shift+TOLERANCE),axis=1)
+            trianglesFirst,trianglesSecond,pairQuery,shift=trianglesFirst[near],trianglesSecond[near],pairQuery[near],shift[near]
+
+            #Waves doubling in pairs per query, a query that hit skips the rest of its pairs
+            order=np.argsort(pairQuery,kind="stable")
+            trianglesFirst,trianglesSecond,pairQuery,shift=trianglesFirst[order],trianglesSecond[order],pairQuery[order],shift[order]
+            rank=np.arange(len(pairQuery))-np.searchsorted(pairQuery,pairQuery)
+            low,high=0,WAVE_PAIRS
+            while len(rank) and low<=rank.max():
+                members=np.flatnonzero((rank>=low)&(rank<high))
+                members=members[~hit[pairQuery[members]]]
+                if len(members):
+                    overlap=trianglesOverlap(self.triangles[trianglesFirst[members]]+shift[members][:,None],
+                        self.triangles[trianglesSecond[members]])
+                    hit[pairQuery[members][overlap]]=True
+                low,high=high,2*high
+
+    def intersects(self,first,second,offsets):
+        #first,second - (k,) root nodes, offsets - (k,3) placement of first minus the one of second
+        #returns (k,) bool; all pairs are walked together, ACTIVE_PAIRS node pairs per query at a
+        #time with the rest waiting on a stack, so a query stops early once one of its leaves hit
+        offsets=np.asarray(offsets,dtype=float).reshape(-1,3)
+        hit=np.zeros(len(offsets),dtype=bool)
+        pending=[(np.asarray(first),np.asarray(second),np.arange(len(offsets)))]
+        while pending:
+            first,second,query=pending.pop()
+            keep=~hit[query]
+            first,second,query=first[keep],second[keep],query[keep]
+            order=np.argsort(query,kind="stable")
+            first,second,query=first[order],second[order],query[order]
+            waiting=np.arange(len(query))-np.searchsorted(query,query)>=ACTIVE_PAIRS
+            if waiting.any():
+                pending.append((first[waiting],second[waiting],query[waiting]))
+                first,second,query=first[~waiting],second[~waiting],query[~waiting]
+
+            shift=offsets[query]
+            overlap=np.all((self.lower[first]+shift<=self.upper[second]+TOLERANCE) &
+                (self.lower[second]<=self.upper[first]+shift+TOLERANCE),axis=1)
+            first,second,query=first[overlap],second[overlap],query[overlap]
+            leafFirst=self.children[first,0]<0
+            leafSecond=self.children[second,0]<0
+            done=leafFirst&leafSecond
+            if done.any():
+                self.leafHits(first[done],second[done],query[done],offsets,hit)
+            first,second,query=first[~done],second[~done],query[~done]
+            if len(query):
+                splitFirst=~leafFirst[~done] & (leafSecond[~done] | (self.size[first]>=self.size[second]))
+                pending.append((np.where(splitFirst[:,None],self.children[first],first[:,None]).reshape(-1),
+                    np.where(splitFirst[:,None],second[:,None],self.children[second]).reshape(-1),
+                    np.repeat(query,2)))
+        return hit
+
+    def encloses(self,outer,inner,offsets):
+        #outer,inner - (k,) root nodes, offsets - (k,3) placement of inner minus the one of outer;
+        #True where the inner mesh lies inside the outer one: up to ENCLOSED_POINTS triangle centers
+        #of inner well inside the bounds of outer, every ENCLOSED_RAYS ray from each of them crosses
+        #outer an odd number of times. An open mesh such as a bridge encloses nothing
+        offsets=np.asarray(offsets,dtype=float).reshape(-1,3)
+        enclosed=np.zeros(len(offsets),dtype=bool)
+        for query,(outerRoot,innerRoot) in enumerate(zip(np.asarray(outer).tolist(),np.asarray(inner).tolist())):
+            start,amount=self.spans[innerRoot]
+            points=self.triangles[start:start+amount].mean(axis=1)+offsets[query]
+            inside=np.all((points>self.lower[outerRoot]+TOLERANCE)&(points<self.upper[outerRoot]-TOLERANCE),axis=1)
+            points=points[inside][:ENCLOSED_POINTS]
+            if not len(points):
+                continue
+            start,amount=self.spans[outerRoot]
+            enclosed[query]=(rayCrossings(points,ENCLOSED_RAYS,self.triangles[start:start+amount])%2==1).all()
+        return enclosed
+
+
+class MeshWorld(object):
+    def __init__(self,geometry,capacity=256):
+        self.library=MeshLibrary(geometry)
+        self.count=0
+        self.boxes=np.zeros((capacity,6))
+        self.roots=np.zeros(capacity,dtype=np.int64)
+        self.translations=np.zeros((capacity,3))
+
+    def add(self,box,shape):
+        name,rotation,translation=shape
+        if self.count==len(self.boxes):
+            self.boxes=np.concatenate([self.boxes,np.zeros_like(self.boxes)])
+            self.roots=np.concatenate([self.roots,np.zeros_like(self.roots)])
+            self.translations=np.concatenate([self.translations,np.zeros_like(self.translations)])
+        self.boxes[self.count]=box
+        self.roots[self.count]=self.library.roots(name)[rotation]
+        self.translations[self.count]=translation
+        self.count+=1
+
+    def remove(self,box):
+        #rolls back an add of the same box
+        matches=np.flatnonzero((self.boxes[:self.count]==np.asarray(box,dtype=float)).all(axis=1))
+        if len(matches):
+            index=matches[-1]
+            for array in (self.boxes,self.roots,self.translations):
+                array[index:self.count-1]=array[index+1:self.count]
+            self.count-=1
+
+    def collidesMany(self,boxes,shapes=None):
+        #boxes - (n,6); without shapes a box overlapping a placed block collides, like in box mode
+        boxes=np.asarray(boxes,dtype=float).reshape(-1,6)
+        collided=np.zeros(len(boxes),dtype=bool)
+        if not self.count or not len(boxes):
+            return collided
+        bounds=np.concatenate([boxes[:,:3].min(axis=0),boxes[:,3:].max(axis=0)])[None]
+        near=np.flatnonzero(boxesOverlapMany(bounds,self.boxes[:self.count])[0])
+        if not len(near):
+            return collided
+        candidate,placed=np.nonzero(boxesOverlapMany(boxes,self.boxes[near]))
+        placed=near[placed]
+        if shapes is None or not len(candidate):
+            collided[candidate]=True
+            return collided
+        name,rotations,translations=shapes
+        rotations=np.asarray(rotations,dtype=np.int64).reshape(-1)
+        translations=np.asarray(translations,dtype=float).reshape(-1,3)
+        first=self.library.roots(name)[rotations[candidate]]
+        offsets=translations[candidate]-self.translations[placed]
+        hits=self.library.intersects(first,self.roots[placed],offsets)
+        #No crossing triangles - one block may still lie completely inside the other
+        rest=np.flatnonzero(~hits)
+        if len(rest):
+            hits[rest]=(self.library.encloses(self.roots[placed[rest]],first[rest],offsets[rest]) |
+                self.library.encloses(first[rest],self.roots[placed[rest]],-offsets[rest]))
+        collided[candidate[hits]]=True
+        return collided
+
+    def collides(self,box,shape=None):
+        if shape is not None:
+            shape=(shape[0],[shape[1]],[shape[2]])
+        return bool(self.collidesMany([box],shape)[0])
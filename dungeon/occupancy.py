@@ -0,0 +1,145 @@
+import math
+
+import numpy as np
+
+
+"""
+Occupancy of the 10 unit lattice, stored in chunks so it is not bounded by distanceAmount
+    OccupancyGrid - per cell counter of the boxes covering it, a counter (instead of a flag)
+                    lets overlapping roots be unmarked one at a time
+    BedrockFloor - per column height below which nothing may be placed
+
+Cells are [i*cellSize,(i+1)*cellSize); a box only touches the cells it shares a volume with,
+so boxes that merely touch an occupied cell are still free.
+"""
+
+CHUNK_SIZE=16 #cells per chunk along every axis
+
+def cellRange(minimum,maximum,cellSize):
+    return int(math.floor(minimum/float(cellSize))),int(math.ceil(maximum/float(cellSize)))
+
+def chunkSlices(ranges,chunkSize):
+    #split a cell range into (chunk key, local slices) pieces
+    pieces=[[]]
+    for start,end in ranges:
+        axisPieces=[]
+        for chunk in range(start//chunkSize,(end-1)//chunkSize+1):
+            offset=chunk*chunkSize
+            axisPieces.append((chunk,slice(max(start,offset)-offset,min(end,offset+chunkSize)-offset)))
+        pieces=[piece+[axisPiece] for piece in pieces for axisPiece in axisPieces]
+    for piece in pieces:
+        yield tuple(axis[0] for axis in piece),tuple(axis[1] for axis in piece)
+
+
+class OccupancyGrid(object):
+    def __init__(self,cellSize=10,chunkSize=CHUNK_SIZE):
+        self.cellSize=cellSize
+        self.chunkSize=chunkSize
+        self.chunks={}
+
+    def isAligned(self,box):
+        return all(value%self.cellSize==0 for value in box)
+
+    def cells(self,box):
+        return (cellRange(box[0],box[3],self.cellSize),
+            cellRange(box[1],box[4],self.cellSize),
+            cellRange(box[2],box[5],self.cellSize))
+
+    def isFree(self,box):
+        for key,slices in chunkSlices(self.cells(box),self.chunkSize):
+            chunk=self.chunks.get(key)
+            if chunk is not None and chunk[slices].any():
+                return False
+        return True
+
+    def mark(self,box,amount=1):
+        for key,slices in chunkSlices(self.cells(box),self.chunkSize):
+            chunk=self.chunks.get(key)
+            if chunk is None:
+                chunk=self.chunks[key]=np.zeros((self.chunkSize,)*3,dtype=np.uint16)
+            chunk[slices]+=amount
+
+    def unmark(self,box):
+        #checked before any chunk changes, an unsigned counter would wrap around below zero
+        pieces=list(chunkSlices(self.cells(box),self.chunkSize))
+        for key,slices in pieces:
+            chunk=self.chunks.get(key)
+            if chunk is None or not chunk[slices].all():
+                raise ValueError("unmark of a box that is not marked: "+str(tuple(box)))
+        for key,slices in pieces:
+            chunk=self.chunks[key]
+            np.subtract(chunk[slices],1,out=chunk[slices],casting="unsafe")
+
+    def window(self,low,high):
+        #dense copy of the cells [low,high) along every axis
+        dense=np.zeros([high[axis]-low[axis] for axis in range(3)],dtype=np.uint16)
+        for key,slices in chunkSlices(list(zip(low,high)),self.chunkSize):
+            chunk=self.chunks.get(key)
+            if chunk is None:
+                continue
+            target=tuple(slice(key[axis]*self.chunkSize+slices[axis].start-low[axis],
+                key[axis]*self.chunkSize+slices[axis].stop-low[axis]) for axis in range(3))
+            dense[target]=chunk[slices]
+        return dense
+
+    def occupiedMany(self,low,high):
+        #low/high - (n,3) cell ranges, True where any of the cells is occupied
+        if not len(low):
+            return np.zeros(0,dtype=bool)
+        windowLow=low.min(axis=0)
+        windowHigh=high.max(axis=0)
+        summed=np.zeros(tuple(windowHigh-windowLow+1),dtype=np.int64)
+        summed[1:,1:,1:]=self.window(windowLow,windowHigh).cumsum(0).cumsum(1).cumsum(2)
+        x0,y0,z0=(low-windowLow).T
+        x1,y1,z1=(high-windowLow).T
+        total=(summed[x1,y1,z1]-summed[x0,y1,z1]-summed[x1,y0,z1]-summed[x1,y1,z0]
+            +summed[x0,y0,z1]+summed[x0,y1,z0]+summed[x1,y0,z0]-summed[x0,y0,z0])
+        return total>0
+
+
+class BedrockFloor(object):
+    def __init__(self,terrain,cellSize=10,chunkSize=CHUNK_SIZE):
+        self.terrain=terrain
+        self.cellSize=cellSize
+        self.chunkSize=chunkSize
+        self.chunks={}
+
+    def chunk(self,key):
+        chunk=self.chunks.get(key)
+        if chunk is None:
+            #bedrock height sampled in the middle of every column
+            columns=np.arange(self.chunkSize)+0.5
+            x,z=np.meshgrid((key[0]*self.chunkSize+columns)*self.cellSize,
+                (key[1]*self.chunkSize+columns)*self.cellSize,indexing="ij")
+            chunk=self.terrain.bedrockHeights(x,z)
+            self.chunks[key]=chunk
+        return chunk
+
+    def highest(self,box):
+        ranges=(cellRange(box[0],box[3],self.cellSize),cellRange(box[2],box[5],self.cellSize))
+        return max(self.chunk(key)[slices].max() for key,slices in chunkSlices(ranges,self.chunkSize))
+
+    def collides(self,box):
+        return box[1]<self.highest(box)
+
+    def highestMany(self,low,high):
+        #low/high - (n,2) column ranges along x and z
+        windowLow=low.min(axis=0)
+        windowHigh=high.max(axis=0)
+        floors=np.empty(tuple(windowHigh-windowLow))
+        for key,slices in chunkSlices(list(zip(windowLow,windowHigh)),self.chunkSize):
+            target=tuple(slice(key[axis]*self.chunkSize+slices[axis].start-windowLow[axis],
+                key[axis]*self.chunkSize+slices[axis].stop-windowLow[axis]) for axis in range(2))
+            floors[target]=self.chunk(key)[slices]
+
+        highest=np.empty(len(low))
+        sizes=high-low
+        #the columns under every footprint gathered at once per footprint size, a preset only
+        #has a couple of them; the cost follows the candidates, not the width of the window
+        for size in np.unique(sizes,axis=0):
+            members=np.all(sizes==size,axis=1)
+            start=low[members]-windowLow
+            x=(start[:,0,None]+np.repeat(np.arange(size[0]),size[1])[None])
+            z=(start[:,1,None]+np.tile(np.arange(size[1]),size[0])[None])
+            highest[members]=floors[x,z].max(axis=1)
+        return highest
@@ -0,0 +1,67 @@
+import numpy as np
+
+from .collision import rotatedBoxes
+from .compatibility import CompatibilityTable
+from .store import Interner
+
+
+"""
+PresetRotations - everything of a block preset that depends on its rotation, for all four
+90 degree rotations, built once when the catalog loads
+    inputs/outputs - (4,n,3) connector offsets from the block origin
+    pillars - (4,n,3) pillar anchor offsets
+    props - (4,n,3) prop spawn offsets, propTags/propChances hold the rest of each entry
+    boxes - (4,6) local collision box
+    id - the preset's index in dungeonBlocksData["presetIds"], propTagIds - its prop tags in
+         dungeonBlocksData["propTags"]
+Index 0..3 stands for rotation 0,90,180,270 (ROTATIONS[index]).
+"""
+
+ROTATIONS=[0,90,180,270]
+
+def rotationIndex(rotation):
+    return (int(rotation)%360)//90
+
+def rotatePoints(points,rotation):
+    #rotation around the Y axis, same direction as cmds.rotate(0,rotation,0)
+    points=np.asarray(points,dtype=float).reshape(-1,3)
+    x,y,z=points[:,0],points[:,1],points[:,2]
+    index=rotationIndex(rotation)
+    if index==1:
+        return np.stack([z,y,-x],axis=1)
+    if index==2:
+        return np.stack([-x,y,-z],axis=1)
+    if index==3:
+        return np.stack([-z,y,x],axis=1)
+    return points.copy()
+
+def rotateAll(points):
+    return np.stack([rotatePoints(points,rotation) for rotation in ROTATIONS])
+
+
+class PresetRotations(object):
+    def __init__(self,data,presetId=0,propTags=None):
+        self.id=presetId
+        self.inputs=rotateAll(data["connector_input"])
+        self.outputs=rotateAll(data["connector_output"])
+        self.pillars=rotateAll([(pillar[0]+5,pillar[1],pillar[2]+5) for pillar in data.get("pillars",[])])
+        self.props=rotateAll([(prop[2]+5,prop[3],prop[4]+5) for prop in data.get("props",[])])
+        self.propTags=[prop[0] for prop in data.get("props",[])]
+        self.propChances=np.array([prop[1] for prop in data.get("props",[])],dtype=float)
+        propTags=propTags if propTags is not None else Interner()
+        self.propTagIds=np.array([propTags.id(tag) for tag in self.propTags],dtype=np.int32)
+        boxes=rotatedBoxes(data["size_x"]*10,data["size_y"]*10,data["size_z"]*10)
+        self.boxes=np.array([boxes[rotation] for rotation in ROTATIONS],dtype=float)
+
+def buildRotationTables(dungeonBlocksData):
+    #block presets and prop tags get integer ids, in name order whatever order blockList has
+    #(layout files keep their own first use order); the connector compatibility table sits on
+    #the finished tables and works out a preset's bits when a layout first asks for them
+    presetIds=dungeonBlocksData["presetIds"]=Interner(sorted(dungeonBlocksData["blockList"]))
+    propTags=dungeonBlocksData["propTags"]=Interner(sorted(set(prop[0] for blockName in dungeonBlocksData["blockList"]
+        for prop in dungeonBlocksData["rooms"+blockName].get("props",[]))))
+    for blockName in dungeonBlocksData["blockList"]:
+        dungeonBlocksData["rotations"+blockName]=PresetRotations(dungeonBlocksData["rooms"+blockName],
+            presetIds.ids[blockName],propTags)
+    dungeonBlocksData["compatibility"]=CompatibilityTable(presetIds.names,
+        [dungeonBlocksData["rotations"+blockName] for blockName in presetIds.names])
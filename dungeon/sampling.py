@@ -0,0 +1,103 @@
+import bisect
+
+import numpy as np
+
+
+"""
+WeightedSampler - presets of one tag with their cumulative freq, built once per catalog
+
+RNG stream: every sample draws exactly one rng.random() and picks the first preset whose
+cumulative weight is above draw*total - the same pick the old linear weightedChoice made,
+so a seed gives the same presets as before. sampleMany draws in order, one value per sample.
+
+dungeonBlocksData["samplers"][(kind,tag)] - kind is "rooms" or "props", tag None for all presets
+
+ShuffledRange - a seeded permutation of range(size) read a slice at a time without building it,
+                for candidate lists far longer than the part a search ever looks at. A balanced
+                Feistel network shuffles the next even power of two, values past the range are
+                shuffled again until they land inside it (cycle walking)
+"""
+
+FEISTEL_ROUNDS=4
+FEISTEL_MULTIPLIER=np.uint64(0x9E3779B97F4A7C15)
+
+class WeightedSampler(object):
+    def __init__(self,choices,weights):
+        self.choices=list(choices)
+        self.cumulative=[]
+        total=0
+        for weight in weights:
+            total+=weight
+            self.cumulative.append(total)
+        self.total=total
+        self.cumulativeArray=np.array(self.cumulative,dtype=float)
+
+    def __len__(self):
+        return len(self.choices)
+
+    def pick(self,draw):
+        #draw - a value in [0,1)
+        if not self.choices:
+            raise ValueError("There are no presets to choose from")
+        index=bisect.bisect_right(self.cumulative,draw*self.total)
+        return self.choices[min(index,len(self.choices)-1)]
+
+    def sample(self,rng):
+        return self.pick(rng.random())
+
+    def sampleMany(self,rng,amount):
+        return self.pickMany([rng.random() for i in range(amount)])
+
+    def pickMany(self,draws):
+        return [self.choices[index] for index in self.indicesMany(draws)]
+
+    def indicesMany(self,draws):
+        #index into choices of every draw, as an array
+        if not self.choices:
+            raise ValueError("There are no presets to choose from")
+        indices=np.searchsorted(self.cumulativeArray,np.asarray(draws,dtype=float)*self.total,side="right")
+        return np.minimum(indices,len(self.choices)-1)
+
+
+class ShuffledRange(object):
+    def __init__(self,size,rng):
+        #rng - numpy Generator, the keys are its only draw
+        self.size=size
+        bits=max(2,(size-1).bit_length())
+        self.half=np.uint64((bits+1)//2)
+        self.mask=np.uint64((1<<int(self.half))-1)
+        self.keys=rng.integers(0,1<<32,size=FEISTEL_ROUNDS,dtype=np.uint64)
+
+    def __len__(self):
+        return self.size
+
+    def shuffle(self,values):
+        left=values>>self.half
+        right=values&self.mask
+        for key in self.keys:
+            mixed=(right^key)*FEISTEL_MULTIPLIER
+            left,right=right,left^((mixed^(mixed>>np.uint64(32)))&self.mask)
+        return (left<<self.half)|right
+
+    def take(self,start,stop):
+        #values at positions start to stop of the permutation, as int64
+        values=self.shuffle(np.arange(start,min(stop,self.size),dtype=np.uint64))
+        outside=np.flatnonzero(values>=self.size)
+        while len(outside):
+            values[outside]=self.shuffle(values[outside])
+            outside=outside[values[outside]>=self.size]
+        return values.astype(np.int64)
+
+
+def buildSamplers(dungeonBlocksData):
+    samplers={}
+    for kind,listName in (("rooms","blockList"),("props","propList")):
+        members={None:[]}
+        for name in dungeonBlocksData[listName]:
+            members[None].append(name)
+            for tag in dungeonBlocksData[kind+name]["tags"]:
+                members.setdefault(tag,[]).append(name)
+        for tag,names in members.items():
+            samplers[(kind,tag)]=WeightedSampler(names,[dungeonBlocksData[kind+name]["freq"] for name in names])
+    dungeonBlocksData["samplers"]=samplers
+    return samplers
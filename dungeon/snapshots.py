@@ -0,0 +1,85 @@
+import hashlib
+import json
+import random
+import threading
+from collections import OrderedDict
+
+
+"""
+Stage streams and snapshots
+
+Every stage draws from its own random stream, derived from the seed and the stage name, so
+a stage only changes when the seed, its own parameters or the result of an earlier stage do.
+
+StageCache keeps the layout state after each stage, keyed by
+    seed, stage, the parameters of that stage and every stage before it,
+    the catalog fingerprint the stage depends on and the terrain fingerprint
+A generator given a cache resumes from the latest stage whose key is cached. One cache may be
+shared by generators on several threads, a superseded run may still be reading or writing it.
+
+Snapshots are plain data (preset names, rotations, positions, connector indices) so they
+stay valid when the catalog is reloaded with the same content.
+"""
+
+#stage - parameters it reads, later stages depend on the ones of every earlier stage as well
+STAGES=[("roots",("rootsAmount","distanceAmount","center","regions")),
+    ("base",("baseAmount","maxFailures","meshCollision")),
+    ("infrastructure",("structureAmount",)),
+    ("stairs",()),
+    ("pillars",()),
+    ("props",("propSpacing",))]
+
+#stage - catalog fingerprint it depends on; prop spawn points and prop presets only matter from pillars on
+CATALOG_PARTS={"roots":"structure","base":"structure","infrastructure":"structure","stairs":"structure",
+    "pillars":"full","props":"full"}
+
+def stageRandom(seed,name):
+    #a str seed goes through sha512 in random.seed, so the stream is the same in every process
+    return random.Random(str(seed)+"/"+name)
+
+def fingerprint(value):
+    return hashlib.md5(json.dumps(value,sort_keys=True).encode("utf-8")).hexdigest()
+
+def catalogFingerprints(presets):
+    #structure leaves out what only pillars and props read
+    rooms=dict((name,dict((key,value) for key,value in data.items() if key!="props"))
+        for name,data in presets["rooms"].items())
+    return {"structure":fingerprint({"rooms":rooms}),"full":fingerprint(presets)}
+
+def stageKeys(seed,parameters,catalogPrints,terrainPrint):
+    #stage - cache key, in stage order
+    keys=[]
+    used=[]
+    for name,names in STAGES:
+        used.extend((parameter,parameters[parameter]) for parameter in names)
+        keys.append((name,(seed,name,tuple(used),catalogPrints[CATALOG_PARTS[name]],terrainPrint)))
+    return keys
+
+
+class StageCache(object):
+    def __init__(self,maxEntries=64):
+        self.maxEntries=maxEntries
+        self.entries=OrderedDict() #key - snapshot, least recently used first
+        self.lock=threading.Lock() #get also reorders the entries, every access holds it
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def get(self,key):
+        with self.lock:
+            snapshot=self.entries.get(key)
+            if snapshot is not None:
+                self.entries.move_to_end(key)
+            return snapshot
+
+    def put(self,key,snapshot):
+        with self.lock:
+            self.entries[key]=snapshot
+            self.entries.move_to_end(key)
+            while len(self.entries)>self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
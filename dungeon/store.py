@@ -0,0 +1,74 @@
+import numpy as np
+
+
+"""
+Compact storage for the bookkeeping of a growing layout
+    ArrayBuffer - rows appended to a NumPy array that doubles when full, view() is the filled part
+    Interner - names mapped to small integer ids in first seen order, names[id] maps back
+    SpawnStore - struct of arrays of the prop spawn points of the placed blocks
+
+A row costs its dtype and nothing else, so memory per placed element stays the same
+however many blocks the layout holds.
+"""
+
+class ArrayBuffer(object):
+    def __init__(self,row=(),dtype=float,capacity=256):
+        self.array=np.zeros((capacity,)+tuple(row),dtype=dtype)
+        self.count=0
+
+    def __len__(self):
+        return self.count
+
+    def extend(self,rows):
+        rows=np.asarray(rows,dtype=self.array.dtype).reshape((-1,)+self.array.shape[1:])
+        needed=self.count+len(rows)
+        if needed>len(self.array):
+            grown=np.zeros((max(needed,2*len(self.array)),)+self.array.shape[1:],dtype=self.array.dtype)
+            grown[:self.count]=self.array[:self.count]
+            self.array=grown
+        self.array[self.count:needed]=rows
+        self.count=needed
+
+    def view(self):
+        return self.array[:self.count]
+
+    def clear(self):
+        self.count=0
+
+
+class Interner(object):
+    def __init__(self,names=()):
+        self.names=[]
+        self.ids={}
+        for name in names:
+            self.id(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def id(self,name):
+        index=self.ids.get(name)
+        if index is None:
+            index=self.ids[name]=len(self.names)
+            self.names.append(name)
+        return index
+
+
+class SpawnStore(object):
+    #tag id, chance and world position of every prop spawn point
+    def __init__(self):
+        self.tags=ArrayBuffer((),np.int32)
+        self.chances=ArrayBuffer((),float)
+        self.positions=ArrayBuffer((3,),float)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def extend(self,tagIds,chances,positions):
+        self.tags.extend(tagIds)
+        self.chances.extend(chances)
+        self.positions.extend(positions)
+
+    def clear(self):
+        for column in (self.tags,self.chances,self.positions):
+            column.clear()
@@ -0,0 +1,77 @@
+import hashlib
+import json
+
+import numpy as np
+
+
+"""
+Terrain - the deformed terrain disc as a NumPy heightfield
+    vertices - (n,3) world space vertices, the places roots may spawn on
+    heights - one height per 10x10 column over the bounds of the vertices, the mean of the
+              vertices inside it; empty columns take the mean of their filled neighbours
+    heightAt/heightsAt - column height, the edge column outside the disc
+    bedrockHeights - height of the bedrock layer under points, the terrain moved 10 units down;
+                     occupancy.BedrockFloor samples it once per column
+    fingerprint - hash of the vertices, part of the stage snapshot keys
+"""
+
+BEDROCK_OFFSET=10
+CELL_SIZE=10
+
+def loadTerrain(path):
+    with open(path,"r") as fileHandle:
+        return Terrain(json.load(fileHandle))
+
+def saveTerrain(path,vertexPositions):
+    with open(path,"w") as fileHandle:
+        json.dump(np.asarray(vertexPositions,dtype=float).reshape(-1,3).tolist(),fileHandle)
+
+
+class Terrain(object):
+    def __init__(self,vertexPositions,cellSize=CELL_SIZE):
+        self.vertices=np.asarray(vertexPositions,dtype=float).reshape(-1,3)
+        self.cellSize=cellSize
+        self.fingerprint=hashlib.md5(np.ascontiguousarray(self.vertices).tobytes()).hexdigest()
+        if not len(self.vertices):
+            self.origin=np.zeros(2,dtype=np.int64)
+            self.heights=np.zeros((1,1))
+            return
+
+        #Bin the vertices into columns
+        columns=np.floor(self.vertices[:,[0,2]]/cellSize).astype(np.int64)
+        self.origin=columns.min(axis=0)
+        columns-=self.origin
+        shape=tuple(columns.max(axis=0)+1)
+        sums=np.zeros(shape)
+        counts=np.zeros(shape)
+        np.add.at(sums,(columns[:,0],columns[:,1]),self.vertices[:,1])
+        np.add.at(counts,(columns[:,0],columns[:,1]),1)
+        heights=sums/np.maximum(counts,1)
+        filled=counts>0
+
+        #Fill the empty columns from their filled neighbours, one ring per pass
+        while not filled.all():
+            paddedHeights=np.pad(np.where(filled,heights,0),1)
+            paddedFilled=np.pad(filled,1).astype(float)
+            neighbourSums=(paddedHeights[:-2,1:-1]+paddedHeights[2:,1:-1]+paddedHeights[1:-1,:-2]+paddedHeights[1:-1,2:])
+            neighbourCounts=(paddedFilled[:-2,1:-1]+paddedFilled[2:,1:-1]+paddedFilled[1:-1,:-2]+paddedFilled[1:-1,2:])
+            fill=~filled&(neighbourCounts>0)
+            heights=np.where(fill,neighbourSums/np.maximum(neighbourCounts,1),heights)
+            filled=filled|fill
+        self.heights=heights
+
+    @property
+    def vertexPositions(self):
+        return self.vertices.tolist()
+
+    def heightsAt(self,x,z):
+        columns=np.stack([np.floor(np.asarray(x,dtype=float)/self.cellSize),
+            np.floor(np.asarray(z,dtype=float)/self.cellSize)],axis=-1).astype(np.int64)
+        columns=np.clip(columns-self.origin,0,np.array(self.heights.shape)-1)
+        return self.heights[columns[...,0],columns[...,1]]
+
+    def heightAt(self,x,z):
+        return float(self.heightsAt(x,z))
+
+    def bedrockHeights(self,x,z):
+        return self.heightsAt(x,z)-BEDROCK_OFFSET
@@ -0,0 +1,178 @@
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import catalog, layout, layoutfile, terrain
+
+
+"""
+Tiled worlds - a large terrain split into square tiles generated in parallel, then stitched
+
+    python -m dungeon.tiles --terrain world.json --seed city --tile-size 400 --output city
+
+Every tile is a temple of its own: derived seed, terrain cut to the tile, root chances falling
+off from the tile center and a collision region that keeps it out of the boundary strips, the
+STRIP wide bands centered on the tile edges. A worker only holds one tile at a time.
+
+Stitching runs once all tiles are done: the tiles are merged in tile order, only the open
+outputs lying in a strip stay in the frontier, and stitchTag blocks (bridges by default) are
+grown inside the strips to link the tiles; their pillars and props follow. The result only
+depends on the seed and the settings, never on the amount of workers.
+"""
+
+TILE_SIZE=400
+STRIP=60
+
+#state of a worker process, loaded once by its initializer
+workerState={}
+
+def tileSeed(seed,tile):
+    return str(seed)+"/tile/"+str(tile[0])+","+str(tile[1])
+
+def tileCenter(tile,tileSize):
+    return ((tile[0]+0.5)*tileSize,(tile[1]+0.5)*tileSize)
+
+def tileRegion(tile,tileSize,strip):
+    #minX,minZ,maxX,maxZ the blocks of a tile stay in
+    return (tile[0]*tileSize+strip/2.0,tile[1]*tileSize+strip/2.0,
+        (tile[0]+1)*tileSize-strip/2.0,(tile[1]+1)*tileSize-strip/2.0)
+
+def tileVertices(vertices,tileSize,margin=0):
+    #tile - vertices over it (margin wider on every side), in tile order
+    tiles={}
+    keys=np.floor(vertices[:,[0,2]]/tileSize).astype(np.int64)
+    for tile in sorted(set(map(tuple,keys.tolist()))):
+        low=np.array(tile,dtype=float)*tileSize-margin
+        high=low+tileSize+2*margin
+        inside=np.all((vertices[:,[0,2]]>=low)&(vertices[:,[0,2]]<high),axis=1)
+        tiles[tile]=vertices[inside]
+    return tiles
+
+def stripRegions(tiles,tileSize,strip):
+    #one rectangle along every edge two tiles share
+    regions=[]
+    tiles=set(tiles)
+    for tileX,tileZ in sorted(tiles):
+        if (tileX+1,tileZ) in tiles:
+            edge=(tileX+1)*tileSize
+            regions.append((edge-strip/2.0,tileZ*tileSize,edge+strip/2.0,(tileZ+1)*tileSize))
+        if (tileX,tileZ+1) in tiles:
+            edge=(tileZ+1)*tileSize
+            regions.append((tileX*tileSize,edge-strip/2.0,(tileX+1)*tileSize,edge+strip/2.0))
+    return regions
+
+#Tiles
+def initWorker(resourcePath):
+    workerState["dungeonBlocksData"]=catalog.loadCatalog(resourcePath)
+
+def generateTile(tile,vertices,seed,parameters,tileSize,strip):
+    start=time.perf_counter()
+    generator=layout.LayoutGenerator(workerState["dungeonBlocksData"],terrain.Terrain(vertices),tileSeed(seed,tile))
+    for key,value in parameters.items():
+        setattr(generator,key,value)
+    generator.center=tileCenter(tile,tileSize)
+    generator.collisionWorld.regions=[tileRegion(tile,tileSize,strip)]
+    try:
+        generator.generate()
+    except ValueError: #no root on this tile, it stays empty
+        return tile,None,time.perf_counter()-start
+    return tile,generator.snapshot(),time.perf_counter()-start
+
+def mergeSnapshots(snapshots):
+    #one snapshot of every tile, block indices moved past the blocks of the tiles before
+    merged={"blocks":[],"openInputs":[],"openOutputs":[],"pillars":[],"props":[],"failures":{}}
+    for snapshot in snapshots:
+        offset=len(merged["blocks"])
+        merged["blocks"].extend(snapshot["blocks"])
+        for key in ("openInputs","openOutputs"):
+            merged[key].extend((blockIndex+offset,isInput,index) for blockIndex,isInput,index in snapshot[key])
+        merged["pillars"].extend(snapshot["pillars"])
+        merged["props"].extend(snapshot["props"])
+        for tag,amount in snapshot["failures"].items():
+            merged["failures"][tag]=merged["failures"].get(tag,0)+amount
+    return merged
+
+#Stitching
+def stitch(dungeonBlocksData,ground,seed,parameters,merged,regions,stitchTag="bridge",stitchAmount=None):
+    generator=layout.LayoutGenerator(dungeonBlocksData,ground,seed)
+    for key,value in parameters.items():
+        setattr(generator,key,value)
+    generator.layout=layout.Layout(seed,generator.parameters())
+    generator.restore(merged)
+    #only the new blocks get pillars and props, only outputs in a strip can be linked
+    generator.pillarAnchors.clear()
+    generator.propSpawns.clear()
+    if regions:
+        generator.collisionWorld.regions=regions
+        inside=generator.collisionWorld.insideRegions(np.tile(generator.frontier.positions[:len(generator.frontier.connectors)],2))
+        for conn in list(generator.frontier.ids):
+            if not inside[generator.frontier.ids[conn]]:
+                generator.frontier.remove(conn)
+        amount=stitchAmount if stitchAmount is not None else 2*len(regions)
+        generator.runStage("stitch",generator.appendBlocks,amount=amount,tag=stitchTag)
+        generator.collisionWorld.regions=None
+        generator.runStage("stitchPillars",generator.pillarMaking)
+        generator.runStage("stitchProps",generator.propMaking)
+    return generator
+
+def generateWorld(resourcePath,ground,seed,parameters=None,tileSize=TILE_SIZE,strip=STRIP,workers=None,
+        stitchTag="bridge",stitchAmount=None):
+    #ground - Terrain of the whole world; returns the stitching LayoutGenerator, its layout is the world
+    parameters=dict(parameters or {})
+    parameters.setdefault("distanceAmount",tileSize*math.sqrt(0.5))
+    workers=workers or os.cpu_count() or 1
+    dungeonBlocksData=catalog.loadCatalog(resourcePath) #builds the cache once before the workers read it
+
+    tiles=tileVertices(ground.vertices,tileSize,margin=strip)
+    timings={}
+    snapshots={}
+    with ProcessPoolExecutor(max_workers=workers,initializer=initWorker,initargs=(resourcePath,)) as executor:
+        futures=[executor.submit(generateTile,tile,vertices,seed,parameters,tileSize,strip) for tile,vertices in tiles.items()]
+        for future in futures:
+            tile,snapshot,seconds=future.result()
+            timings[tile]=seconds
+            if snapshot is not None:
+                snapshots[tile]=snapshot
+
+    merged=mergeSnapshots([snapshots[tile] for tile in sorted(snapshots)])
+    generator=stitch(dungeonBlocksData,ground,seed,parameters,merged,stripRegions(snapshots,tileSize,strip),
+        stitchTag,stitchAmount)
+    generator.timings["tiles"]=dict((str(tile[0])+","+str(tile[1]),seconds) for tile,seconds in timings.items())
+    return generator
+
+def main(arguments=None):
+    parser=argparse.ArgumentParser(description="Generate a world of temples tile by tile.")
+    parser.add_argument("--terrain",required=True,help="JSON list of terrain vertex positions")
+    parser.add_argument("--seed",required=True)
+    parser.add_argument("--resources",default="dungeon_resources",help="dungeon_resources folder")
+    parser.add_argument("--output",required=True,help="layout file written for the world")
+    parser.add_argument("--tile-size",type=float,default=TILE_SIZE)
+    parser.add_argument("--strip",type=float,default=STRIP,help="width of the band between two tiles")
+    parser.add_argument("--workers",type=int,default=None,help="worker processes, one per core by default")
+    parser.add_argument("--base-amount",type=int,default=15,help="per tile")
+    parser.add_argument("--structure-amount",type=int,default=15,help="per tile")
+    parser.add_argument("--roots-amount",type=float,default=1.0)
+    parser.add_argument("--mesh-collision",action="store_true",help="test blocks with their triangles instead of their boxes")
+    parser.add_argument("--stitch-tag",default="bridge",help="tag of the blocks linking two tiles")
+    parser.add_argument("--stitch-amount",type=int,default=None,help="linking blocks, two per shared edge by default")
+    arguments=parser.parse_args(arguments)
+
+    parameters={"baseAmount":arguments.base_amount,
+        "structureAmount":arguments.structure_amount,
+        "rootsAmount":arguments.roots_amount,
+        "meshCollision":arguments.mesh_collision}
+    start=time.perf_counter()
+    generator=generateWorld(arguments.resources,terrain.loadTerrain(arguments.terrain),arguments.seed,parameters,
+        arguments.tile_size,arguments.strip,arguments.workers,arguments.stitch_tag,arguments.stitch_amount)
+    layoutfile.saveLayout(arguments.output,generator.layout,generator.dungeonBlocksData)
+    sys.stdout.write("%d tiles, %d blocks, %d pillars, %d props in %.1fs\n"%(len(generator.timings["tiles"]),
+        len(generator.layout.blocks),len(generator.layout.pillars),len(generator.layout.props),time.perf_counter()-start))
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -1,78 +1,122 @@
 import maya.cmds as cmds
+import maya.api.OpenMaya as om
 import os
-import json
+import sys
 import random
-import maya.mel as mel
+import maya.utils
 import time
-import math
+import threading
+import traceback
 from functools import partial
+from contextlib import contextmanager
+from collections import OrderedDict
+import numpy as np
 
 
-"""
-dungeonBlocksData{}
-    blocklist - list of block names
-    propList - list of prop names
-    <tag>List - list of blocks/props of that tag
-    rooms + blockName - json data
-    props + propName - json data
-    <block> + input/output - list of its connectors for input/output
-"""
-
 #Constants / Variables
 workspacePath=cmds.workspace(q=True, rd=True) + "dungeon_resources/"
+if cmds.workspace(q=True, rd=True) not in sys.path: #the dungeon package lives next to this script
+    sys.path.insert(0,cmds.workspace(q=True, rd=True))
+
+from dungeon import catalog, control, instrumentation, layout, layoutfile, snapshots, terrain
+
+templateLibrary="dungeonTemplates" #hidden groups holding one imported mesh per preset, one per temple
+registryName="dungeonNodes" #objectSet of every node the current temple owns
 seedString=None
 seed=None
-vertexPositions=None
+terrainCache=OrderedDict() #Noise.time - Terrain, going back to a recent seed skips the mesh read
+terrainCacheSize=4 #terrains kept, least recently used ones go first
+currentTerrain=None
+stageCache=snapshots.StageCache() #layout state after each stage, kept between Generate clicks
 
 #Utility Functions
-def weightedChoice(choices,chances):
-    max_chance=0
-    item_chance=[] #contains the chance intervals
-    for i in range(len(choices)):
-        max_chance+=chances[i]
-        item_chance.append(max_chance)
-        
-    choice=random.random() * max_chance #generate between 0 and 1 multiplied by max_chance (so 0 and max_chance)
-    
-    for i in range(len(choices)):
-        if item_chance[i]>choice:
-            return(choices[i])
-            
-    return choices[len(choices)-1]
-    
+class NodeRegistry(object):
+    #every node a generation puts in the scene is a member of one objectSet, so tearing the
+    #temple down costs its own nodes instead of a walk over the whole scene
+    def __init__(self,name=registryName):
+        self.name=name
+        
+    def add(self,nodes):
+        if not nodes:
+            return
+        if not cmds.objExists(self.name):
+            cmds.sets(name=self.name,empty=True)
+        cmds.sets(nodes,e=True,addElement=self.name)
+        
+    def nodes(self):
+        if not cmds.objExists(self.name):
+            return []
+        return cmds.sets(self.name,q=True) or []
+        
+    def clear(self):
+        #one delete for all members, the set goes with them
+        nodes=self.nodes()
+        if cmds.objExists(self.name):
+            nodes.append(self.name)
+        if nodes:
+            cmds.delete(nodes)
+        
+@contextmanager
+def sceneChanges(chunkName):
+    #everything done inside is one undo step and the viewport only redraws once at the end,
+    #nested uses fold into the outermost one
+    if cmds.refresh(query=True,suspend=True):
+        yield
+        return
+    cmds.undoInfo(openChunk=True,chunkName=chunkName)
+    cmds.refresh(suspend=True)
+    try:
+        yield
+    finally:
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+        cmds.refresh()
+
+@contextmanager
+def unrecorded():
+    #scene changes kept out of the undo queue - the OpenMaya mesh building cannot be undone,
+    #recording the cmds calls around it would only leave undo steps that half work
+    state=cmds.undoInfo(query=True,stateWithoutFlush=True)
+    cmds.undoInfo(stateWithoutFlush=False)
+    try:
+        yield
+    finally:
+        cmds.undoInfo(stateWithoutFlush=state)
+
 def deleteAll():
-    for element in cmds.ls():
-        if "block" in element:
-            if cmds.objExists(element):
-                cmds.delete(element)
-        elif "prop" in element:
-            if cmds.objExists(element):
-                cmds.delete(element)
-        elif "collisionBox" in element:
-            if cmds.objExists(element):
-                cmds.delete(element)
+    registry=NodeRegistry()
+    if cmds.objExists(registry.name):
+        registry.clear()
+    else: #scenes built before the registry existed
+        nodes=cmds.ls("block*","prop*","collisionBox*",type="transform")
+        if nodes:
+            cmds.delete(nodes)
     cmds.select(clear=True)
 
-def detectCollision(obj1,obj2,*args):
-    collided=None
-    
-    duplicateInputRoom=cmds.duplicate(obj1,n=obj1+'d', renameChildren=True)
-    duplicateOutputRoom=cmds.duplicate(obj2,n=obj2+'d', renameChildren=True)
-    
-    cmds.scriptEditorInfo(historyFilename=workspacePath+"log.txt", writeHistory=True) #start noting the history
-    cmds.polyCBoolOp(duplicateInputRoom[0],duplicateOutputRoom[0],op=3,n='auxIntersection') #try for warning
-    cmds.scriptEditorInfo(writeHistory=False) #stop recording information
-    with open(workspacePath+"log.txt",'r') as f:
-        lines= f.readlines()
-        collided = len(lines)==0 #if the file is empty of any error - then there is an intersection/collision
-    os.remove(workspacePath+"log.txt") #remove it
-    
-    cmds.delete(duplicateInputRoom)
-    cmds.delete(duplicateOutputRoom)
-    cmds.delete('auxIntersection')
-    
-    return collided
-   
+def flattenInstances():
+    #turns every instanced block/prop into a real copy, meant to run right before exporting
+    registry=NodeRegistry()
+    libraries=[node for node in registry.nodes() if node.startswith(templateLibrary)]
+    copies=[]
+    for node in cmds.ls(registry.nodes(),type="transform"):
+        if node in libraries:
+            continue
+        shapes=cmds.listRelatives(node,shapes=True,fullPath=True) or []
+        if shapes and len(cmds.listRelatives(shapes[0],allParents=True))>1:
+            copy=cmds.duplicate(node)[0]
+            cmds.delete(node)
+            copies.append(cmds.rename(copy,node.split("|")[-1]))
+    registry.add(copies)
+    if libraries:
+        cmds.delete(libraries)
+
+def faceRanges(shape,faces):
+    #sorted face ids as shape.f[start:end] components, one per run of consecutive faces
+    breaks=np.flatnonzero(np.diff(faces)>1)
+    starts=np.concatenate([[0],breaks+1])
+    ends=np.concatenate([breaks,[len(faces)-1]])
+    return ["%s.f[%d:%d]"%(shape,faces[start],faces[end]) for start,end in zip(starts.tolist(),ends.tolist())]
+
 def generateSeed(newSeed=None): #takes one input or None for randomization
     seedString=newSeed
     random.seed(seedString)
@@ -81,478 +125,204 @@ def generateSeed(newSeed=None): #takes one input or None for randomization
         
 
 def getVertexList():
-    global vertexPositions
+    global currentTerrain
     
-    vertexPositions=[]
-    amount=cmds.polyEvaluate("Terrain",vertex=True)
-    for i in range(amount):
-        values=cmds.xform("Terrain.vtx["+str(i)+"]",q=True,worldSpace=True,translation=True)
-        vertexPositions.append(values)
+    noiseTime=cmds.getAttr("Noise.time")
+    if noiseTime in terrainCache:
+        terrainCache.move_to_end(noiseTime)
+    else:
+        #one bulk read of the deformed points instead of an xform per vertex
+        dagPath=om.MSelectionList().add("Terrain").getDagPath(0)
+        points=om.MFnMesh(dagPath).getPoints(om.MSpace.kWorld)
+        terrainCache[noiseTime]=terrain.Terrain(np.array(points)[:,:3]) #MPoints are x,y,z,w
+        while len(terrainCache)>terrainCacheSize:
+            terrainCache.popitem(last=False)
+    currentTerrain=terrainCache[noiseTime]
         
 #---------------------------------------------------------------------------------------
 class DungeonGenerator():
-    def __init__(self):
+    #Maya backend - the layout is computed headless, this only turns it into nodes
+    def __init__(self,dungeonBlocksData=None):
         if not os.path.exists(workspacePath):
             os.makedirs(workspacePath)
         self.resourcePath=workspacePath
         
         #Loading
-        self.dungeonBlocksData={"blockList":[],
-            "baseList":[],
-            "infrastructureList":[],
-            "bridgeList":[],
-            "stairsList":[],
-            
-            "propList":[],
-            "pillarList":[],
-            "treeList":[],
-            "grassList":[]
-        }
-        #Blocks
-        for file in cmds.getFileList(folder=self.resourcePath+"rooms/", filespec='*.json'):
-            blockName=file.replace('.json','')
-            with open(self.resourcePath+"rooms/"+file, "r") as fileHandle:
-                self.dungeonBlocksData["rooms"+blockName]=json.load(fileHandle)
-                
-            self.dungeonBlocksData["blockList"].append(blockName)
-            for tag in self.dungeonBlocksData["rooms"+blockName]["tags"]:
-                self.dungeonBlocksData[tag+"List"].append(blockName)
-        #Props
-        for file in cmds.getFileList(folder=self.resourcePath+"props/", filespec='*.json'):
-            propName=file.replace('.json','')
-            with open(self.resourcePath+"props/"+file, "r") as fileHandle:
-                self.dungeonBlocksData["props"+propName]=json.load(fileHandle)
-                
-            self.dungeonBlocksData["propList"].append(propName)
-            for tag in self.dungeonBlocksData["props"+propName]["tags"]:
-                self.dungeonBlocksData[tag+"List"].append(propName)
-                
-        
-        #Constants      
-        self.blockList=[]
-        self.blockIndex=-1
-        self.blockConnectors={}
-        self.blockPresets={}
-        
-        self.inputConnectorList=[]
-        self.currentConnector=0
-        self.outputConnectorList=[]
-        self.currentPillar=0
-        self.pillarList=[]
-        
-        self.collisionBoxes={}
-        self.collisionUnions=[]
-        self.triedConnections=[]
+        self.dungeonBlocksData=dungeonBlocksData if dungeonBlocksData is not None else catalog.loadCatalog(self.resourcePath)
         
+        #Constants
+        self.blockList=[]
         self.propList=[]
-        self.propIndex=-1
-        self.propConnectors=[]
-        self.propProperties={}
-        self.currentPropConnector=0
+        self.library=None #template group of this temple
+        self.templates={} #preset - template node in the library
+        self.shadingGroups={} #OBJ material - its shading group
+        self.registry=NodeRegistry()
+        self.layout=None
         
         #Editable
+        self.seed=None
+        self.instancing=True #False duplicates the template for every placement instead
         self.baseAmount=15
         self.structureAmount=15
         self.distanceAmount=200
         self.rootsAmount=1.0
+        self.propSpacing={} #prop tag - least distance between two props of it
+        self.meshCollision=False #blocks collide with their triangles instead of their size box
+        self.tracePath=None #Chrome trace of the generation is written here when set
        
         
         
     def importObj(self,target,name="myobj"):
-        cmds.file(self.resourcePath + target, i=True, groupReference=True, groupName=name)
-        
-    def addToCollisionUnion(self,obj):
-        unionAmounts=len(self.collisionUnions)
-        if self.blockIndex>=15*unionAmounts: #amount of blocks in a single union
-            cmds.rename(obj,"collisionUnion"+str(len(self.collisionUnions)))
-            self.collisionUnions.append("collisionUnion"+str(len(self.collisionUnions)))
-        else:
-            self.collisionUnions[unionAmounts-1]=cmds.polyCBoolOp(self.collisionUnions[unionAmounts-1],obj, op=1,ch=False)[0]
-        
-    def spawnProp(self,tag=None):
-        self.propIndex+=1
-        
-        #Spawn prop
-        localPresetList=[]
-        if tag==None:
-            localPresetList=self.dungeonBlocksData["propList"]
-        else:
-            localPresetList=self.dungeonBlocksData[tag+"List"]
-        weights=[]
-        for prop in localPresetList:
-            weights.append(self.dungeonBlocksData["props"+prop]["freq"])
-            
-        propPreset=weightedChoice(localPresetList,weights)
-            
-        propName="prop"+str(self.propIndex)
-        self.importObj("props/"+propPreset+".obj",propName)
-        
-        
-    def spawnBlock(self,tag=None):
-        self.blockIndex+=1
-        
-        #Spawn block
-        localPresetList=[]
-        if tag==None:
-            localPresetList=self.dungeonBlocksData["blockList"]
+        #the mesh is built from the compiled catalog, the .obj is never read again
+        #returns the name Maya gave the group, the requested one may already be taken
+        geometry=self.dungeonBlocksData["geometry"].get(target)
+        name=cmds.group(empty=True,name=name)
+        parent=om.MSelectionList().add(name).getDependNode(0)
+        
+        meshFn=om.MFnMesh()
+        hasUvs=len(geometry["uvs"])>0 and (geometry["faceUvIndices"]>=0).all()
+        if hasUvs:
+            meshFn.create([om.MPoint(*vertex) for vertex in geometry["vertices"].tolist()],
+                geometry["faceCounts"].tolist(),geometry["faceIndices"].tolist(),
+                geometry["uvs"][:,0].tolist(),geometry["uvs"][:,1].tolist(),parent=parent)
+            meshFn.assignUVs(geometry["faceCounts"].tolist(),geometry["faceUvIndices"].tolist())
         else:
-            localPresetList=self.dungeonBlocksData[tag+"List"]
-        weights=[]
-        for block in localPresetList:
-            weights.append(self.dungeonBlocksData["rooms"+block]["freq"])
-            
-        blockPreset=weightedChoice(localPresetList,weights)
-            
-        blockName="block"+str(self.blockIndex)
-        self.importObj("rooms/"+blockPreset+".obj",blockName)
-        self.blockPresets[blockName]=blockPreset
-        
-        #Spawn collision
-        collisionName="collisionBox"+str(self.blockIndex)
-        self.collisionBoxes[blockName]=collisionName
-        size_x=self.dungeonBlocksData["rooms"+blockPreset]["size_x"] * 10
-        size_y=self.dungeonBlocksData["rooms"+blockPreset]["size_y"] * 10
-        size_z=self.dungeonBlocksData["rooms"+blockPreset]["size_z"] * 10
-        cmds.polyCube(name=collisionName,width=size_x,height=size_y,depth=size_z)
-        cmds.move(size_x/2,size_y/2,size_z/2,collisionName)
-        
-        #Spawn connectors
-        localInputConnectors=[]
-        for input in self.dungeonBlocksData["rooms" + blockPreset]["connector_input"]:
-            connectorName='connector'+str(self.currentConnector)
-            cmds.sphere(name=connectorName)
-            self.inputConnectorList.append(connectorName)
-            localInputConnectors.append(connectorName)
-            self.currentConnector+=1
-            
-            cmds.move(input[0],input[1],input[2],connectorName)
-            cmds.parent(connectorName,blockName,relative=True)
-        localOutputConnectors=[]
-        for output in self.dungeonBlocksData["rooms" + blockPreset]["connector_output"]:
-            connectorName='connector'+str(self.currentConnector)
-            cmds.sphere(name=connectorName)
-            self.outputConnectorList.append(connectorName)
-            localOutputConnectors.append(connectorName)
-            self.currentConnector+=1
-            
-            cmds.move(output[0],output[1],output[2],connectorName)
-            cmds.parent(connectorName,blockName,relative=True)
-            
-        self.blockConnectors[blockName+"input"]=localInputConnectors
-        self.blockConnectors[blockName+"output"]=localOutputConnectors
-        
-        #Spawn pillars
-        if "pillars" in self.dungeonBlocksData["rooms" + blockPreset].keys():
-            for pillar in self.dungeonBlocksData["rooms" + blockPreset]["pillars"]:
-                pillarName='pillar'+str(self.currentPillar)
-                cmds.sphere(name=pillarName)
-                self.pillarList.append(pillarName)
-                self.currentPillar+=1
-                
-                cmds.move(pillar[0]+5,pillar[1],pillar[2]+5,pillarName)
-                cmds.parent(pillarName,blockName,relative=True)
-                
-        #Spawn props
-        if "props" in self.dungeonBlocksData["rooms" + blockPreset].keys():
-            for prop in self.dungeonBlocksData["rooms" + blockPreset]["props"]:
-                propName='propSpawn'+str(self.currentPropConnector)
-                cmds.sphere(name=propName)
-                self.propConnectors.append(propName)
-                self.currentPropConnector+=1
-                
-                self.propProperties[propName]=[prop[0],prop[1]]
-                cmds.move(prop[2]+5,prop[3],prop[4]+5,propName)
-                cmds.parent(propName,blockName,relative=True)
-        
-    def generateRoots(self):
-        #Generate Bedrock Layer - to prevent underground structures
-        cmds.duplicate("Terrain",name="bedrock")
-        cmds.move(0,-10,0,"bedrock", r=True)
-       
+            meshFn.create([om.MPoint(*vertex) for vertex in geometry["vertices"].tolist()],
+                geometry["faceCounts"].tolist(),geometry["faceIndices"].tolist(),parent=parent)
+        shape=meshFn.fullPathName()
+        
+        #Smoothing groups - an edge is soft when both its faces are in the same group, "s off" is hard
+        smoothing=geometry["faceSmoothing"]
+        if smoothing.any():
+            edgeIds=[]
+            smooths=[]
+            edges=om.MItMeshEdge(om.MSelectionList().add(shape).getDagPath(0))
+            while not edges.isDone():
+                faces=edges.getConnectedFaces()
+                edgeIds.append(edges.index())
+                smooths.append(len(faces)==2 and smoothing[faces[0]]!=0 and smoothing[faces[0]]==smoothing[faces[1]])
+                edges.next()
+            meshFn.setEdgeSmoothings(edgeIds,smooths)
+            meshFn.cleanupEdgeSmoothing()
             
-        for place in vertexPositions:
-            #Generate Roots
-            chance= place[1]/100.0 *0.05 #encourage higher places
-            distance=math.sqrt(place[0]**2 + place[2]**2)
-            chance*= 1 - distance / 500 #encourage closer to center
-            chance*=self.rootsAmount
-            if chance > random.random() and distance<=self.distanceAmount:
-                self.spawnBlock("base")
-                place[0]=10 * math.floor(place[0]/10)
-                place[1]=10 * math.floor(place[1]/10)
-                place[2]=10 * math.floor(place[2]/10)
-                cmds.move(place[0],place[1],place[2],"block"+str(self.blockIndex), r=True)
-                cmds.move(place[0],place[1],place[2],"collisionBox"+str(self.blockIndex), r=True)
-                
-                
-        if self.blockIndex==-1: #UI - desired amount
-            self.generateRoots()
-        
-    def appendBlocks(self,amount=30,tag=None):
-        
-        while(amount>0):
-            print("Amount",amount)
-            self.spawnBlock(tag)
-            blockName="block"+str(self.blockIndex)
-            collisionName="collisionBox"+str(self.blockIndex)
-            localInputConnectors=self.blockConnectors[blockName+"input"]
-            localOutputConnectors=self.blockConnectors[blockName+"output"]
-                        
-            worked=False
-            #Find Input - Output Combo - exhaustively
-            inputOutputCombos=[]
-            for localInput in localInputConnectors:
-                for outsideOutput in self.outputConnectorList:
-                    if not outsideOutput in localOutputConnectors:
-                        inputOutputCombos.append([localInput,outsideOutput])
-            random.shuffle(inputOutputCombos)
-            
-            rotationAmount=random.choice([0,90,180,270])
-            cmds.rotate(0,rotationAmount,0,blockName,r=True)
-            cmds.rotate(0,rotationAmount,0,collisionName,r=True)             
-            
-            tries=50 #if not found within the first 50 combinations, well tough luck
-            for combo in inputOutputCombos:
-                if worked:
-                    continue
-                if tries<=0:
-                    continue
-                for rotation in range(4):
-                    if worked:
-                        continue
-                    if tries<=0:
-                        break;
-                    #Rotation
-                    cmds.rotate(0,90,0,blockName,r=True)
-                    cmds.rotate(0,90,0,collisionName,r=True)
-                    
-                    #Move
-                    input=combo[0]
-                    output=combo[1]
-                    outputAbsPos=cmds.xform(output,q=True, t=True, ws=True)
-                    outputRelPos=cmds.xform(output,q=True, t=True, r=True)
-                    inputRelPos=cmds.xform(input,q=True, t=True, r=True)
-                    inputAbsPos=cmds.xform(input,q=True, t=True, ws=True)
-                    place=[0,0,0]
-                    for coor in range(3):
-                        place[coor]=outputAbsPos[coor]-inputAbsPos[coor]
-                    cmds.move(place[0],place[1],place[2],blockName, r=True)
-                    cmds.move(place[0],place[1],place[2],collisionName, r=True)
-                    
-                    
-                    #Detect Collision
-                    collided=False
-                    for union in self.collisionUnions:
-                        if detectCollision(union,collisionName):
-                            collided=True
-                            break
-                    if collided==False:
-                        collided=detectCollision("bedrock",collisionName)
-                    print('_')
-                    tries-=1
-                    
-                    if collided==False:
-                       worked=True
-                       break
-                        
-            if worked:                
-                 #Add the block
-                self.blockList.append(blockName)
-                self.addToCollisionUnion(collisionName)               
-                amount-=1
-                
-                #Refresh Viewport
-                if self.blockIndex%10==0:
-                    cmds.refresh()
-                
-                #Remove used inputs
-                if input in self.inputConnectorList:
-                    self.inputConnectorList.remove(input)
-                if output in self.outputConnectorList:
-                    self.outputConnectorList.remove(output)
-                    
-                #Remove all other coinciding inputs/outputs
-                to_remove=[]
-                for conn in localInputConnectors + localOutputConnectors:
-                    for conn2 in self.inputConnectorList + self.outputConnectorList:
-                        if (not conn2 in localInputConnectors + localOutputConnectors):
-                            pos1 = cmds.xform(conn,q=True, t=True, ws=True)
-                            pos2 = cmds.xform(conn2,q=True, t=True, ws=True)
-                            if pos1==pos2:
-                                to_remove.append(conn)
-                                to_remove.append(conn2)
-                for conn in to_remove:
-                    if conn in self.inputConnectorList:
-                        self.inputConnectorList.remove(conn)
-                    if conn in self.outputConnectorList:
-                        self.outputConnectorList.remove(conn)
-                               
-                                
-                                    
-                #TODO remove other touching inputs/outputs
-                print('Worked!')
+        #Normals - the vn of every face corner, set last so they win over the edge smoothing
+        if len(geometry["normals"]) and (geometry["faceNormalIndices"]>=0).all():
+            faceIds=np.repeat(np.arange(len(geometry["faceCounts"])),geometry["faceCounts"])
+            meshFn.setFaceVertexNormals([om.MVector(*normal) for normal in geometry["normals"][geometry["faceNormalIndices"]].tolist()],
+                faceIds.tolist(),geometry["faceIndices"].tolist())
+        meshFn.updateSurface()
+        
+        #Materials - one shading group per usemtl name, faces without one stay on the initial group
+        faceMaterials=geometry["faceMaterials"]
+        for material in np.unique(faceMaterials).tolist():
+            group=self.shadingGroup(geometry["materials"][material]) if material>=0 else "initialShadingGroup"
+            if (faceMaterials==material).all():
+                cmds.sets(shape,e=True,forceElement=group)
             else:
-                for conn in localInputConnectors:
-                    self.inputConnectorList.remove(conn)
-                    cmds.delete(conn)
-                for conn in localOutputConnectors:
-                    self.outputConnectorList.remove(conn)
-                    cmds.delete(conn)
-                cmds.delete(blockName)
-                print("Maximum tries for generation reached")
+                cmds.sets(faceRanges(shape,np.flatnonzero(faceMaterials==material)),e=True,forceElement=group)
+        return name
+        
+    def shadingGroup(self,material):
+        #lambert and shading group of an OBJ material, shared by every preset and temple using it
+        if material not in self.shadingGroups:
+            group=material+"SG"
+            if not cmds.objExists(group):
+                shader=cmds.shadingNode("lambert",asShader=True,name=material)
+                group=cmds.sets(renderable=True,noSurfaceShader=True,empty=True,name=group)
+                cmds.connectAttr(shader+".outColor",group+".surfaceShader")
+            self.shadingGroups[material]=group
+        return self.shadingGroups[material]
+        
+    def importTemplates(self,targets):
+        #the hidden mesh of every preset the temple uses, in a library group of its own. Built
+        #before the undo chunk and left out of the undo queue, so undo never has to take back
+        #the OpenMaya calls; the library only joins the registry inside the chunk. Undoing a
+        #temple leaves its library in the scene for a redo, the next temple deletes libraries
+        #no temple owns any more
+        with unrecorded():
+            owned=set(self.registry.nodes())
+            orphans=[node for node in cmds.ls(templateLibrary+"*",assemblies=True) if node not in owned]
+            if orphans:
+                cmds.delete(orphans)
+            self.library=cmds.group(empty=True,name=templateLibrary)
+            cmds.setAttr(self.library+".visibility",0)
+            for target in sorted(targets):
+                templateName=self.importObj(target,"template"+target.split("/")[-1])
+                self.templates[target]=cmds.parent(templateName,self.library)[0]
+        
+    def instantiate(self,placements,chunkName):
+        #placements - (name, preset path, rotation, translation). Replaces the temple in the
+        #scene: deleting the old one and instancing (or duplicating) the templates are undoable
+        #cmds in one chunk, undo brings the previous temple back in one step. Nodes are added to
+        #the registry at once and parented to the world in a single call; they are only ever
+        #addressed by the names Maya returns, an unrelated block0 may already exist
+        self.importTemplates(set(placement[1] for placement in placements))
+        with sceneChanges(chunkName):
+            deleteAll()
+            nodes=[]
+            for name,target,rotation,translation in placements:
+                if self.instancing:
+                    node=cmds.instance(self.templates[target],name=name)[0]
+                else:
+                    node=cmds.duplicate(self.templates[target],name=name)[0]
+                cmds.xform(node,rotation=(0,rotation,0),translation=tuple(translation))
+                nodes.append(node)
+            if nodes:
+                nodes=cmds.parent(nodes,world=True)
+            self.registry.add([self.library]+nodes)
+        self.blockList=[node for node,placement in zip(nodes,placements) if placement[0].startswith("block")]
+        self.propList=[node for node,placement in zip(nodes,placements) if placement[0].startswith("prop")]
+        
+    def build(self,layout):
+        placements=[("block"+str(block.index),"rooms/"+block.preset,block.rotation,block.translation)
+            for block in layout.blocks]
+        placements+=[("prop"+str(index),"props/"+placement.preset,0,placement.translation)
+            for index,placement in enumerate(layout.pillars+layout.props)]
+        self.instantiate(placements,"dungeonGenerate")
             
-    def stairMaking(self,amount=4):
-        worked=False
-        
-        for conn2 in self.inputConnectorList + self.outputConnectorList:
-            for conn in self.outputConnectorList:
-                if worked:
-                    amount-=1
-                    if amount<=0:
-                        return                   
-                
-                worked=False
-                
-                if (not cmds.objExists(conn)) or (not cmds.objExists(conn2)):
-                    continue
-                
-                pos1 = cmds.xform(conn,q=True, t=True, ws=True)
-                pos2 = cmds.xform(conn2,q=True, t=True, ws=True)
-                isProperHeight = pos2[1]==pos1[1]+5
-                isProperHorizontal=(abs(pos1[0]-pos2[0])==5 and abs(pos1[2]-pos2[2])==0) or (abs(pos1[0]-pos2[0])==0 and abs(pos1[2]-pos2[2])==5)
-                sameParent = cmds.listRelatives(conn,parent=True) == cmds.listRelatives(conn2,parent=True)
-                if isProperHeight and isProperHorizontal and not sameParent:            
-                    self.spawnBlock(tag="stairs")
-                    blockName="block"+str(self.blockIndex)
-                    collisionName="collisionBox"+str(self.blockIndex)
-                        
-                    angle=None
-                    if pos1[2]-pos2[2]==5:
-                        angle=180
-                    elif pos1[2]-pos2[2]==-5:
-                        angle=0
-                    elif pos1[0]-pos2[0]==5:
-                        angle=270
-                    else:
-                        angle=90
-                    
-                                  
-                    cmds.rotate(0,angle,0,blockName,r=True)
-                    cmds.rotate(0,angle,0,collisionName,r=True)
-                   
-                    #Move
-                    localInput=self.blockConnectors[blockName+"input"][0]
-                    localInputPos=cmds.xform(localInput,q=True, t=True, ws=True)
-                    place=[0,0,0]
-                    for coor in range(3):
-                        place[coor]=pos1[coor]-localInputPos[coor]
-                    cmds.move(place[0],place[1],place[2],blockName, r=True)
-                    cmds.move(place[0],place[1],place[2],collisionName, r=True)
-                    
-                    
-                    #Detect Collision
-                    collided=False
-                    for union in self.collisionUnions:
-                        if detectCollision(union,collisionName):
-                            collided=True
-                            break
-                    if collided==False:
-                        collided=detectCollision("bedrock",collisionName)
-                        
-                    if collided==False:
-                       worked=True
-                    else:
-                        cmds.delete(blockName)
-                        
-    def pillarMaking(self):            
-        for pillar in self.pillarList: #find pillar position
-            if cmds.objExists(pillar):
-                for height in range(1,10): #make pillars all the way down
-                    pillarPos=cmds.xform(pillar,q=True, t=True, ws=True)
-                    pillarPos[1]-=10*height
-                    
-                    if pillarPos[1]<-20:
-                        break
-                    
-                    self.spawnProp(tag="pillar")
-                    pillarName="prop"+str(self.propIndex)
-                    cmds.move(pillarPos[0]-5,pillarPos[1],pillarPos[2]-5,pillarName)
-                    
-                    collided=False
-                    for union in self.collisionUnions:
-                        if detectCollision(union,pillarName):
-                            collided=True
-                            break
-                    if collided==False:
-                        collided=detectCollision("bedrock",pillarName)
-                        
-                    if collided:
-                        cmds.delete(pillarName)
-                        break
+    def compute(self,budget=None,cancelToken=None,progress=None):
+        #headless part only, it never touches the scene and may run off the main thread
+        self.recorder=instrumentation.Recorder() if self.tracePath else None
+        generator=layout.LayoutGenerator(self.dungeonBlocksData,currentTerrain,self.seed,stageCache,self.recorder)
+        generator.baseAmount=self.baseAmount
+        generator.structureAmount=self.structureAmount
+        generator.distanceAmount=self.distanceAmount
+        generator.rootsAmount=self.rootsAmount
+        generator.propSpacing=self.propSpacing
+        generator.meshCollision=self.meshCollision
+        self.layout=generator.generate(budget,cancelToken,progress)
+        return self.layout
+        
+    def commit(self):
+        #scene part, main thread only
+        if self.recorder is not None:
+            with self.recorder.stage("build"):
+                self.build(self.layout)
+            self.recorder.writeChromeTrace(self.tracePath)
+        else:
+            self.build(self.layout)
             
-    def propMaking(self):
-        for propConn in self.propConnectors:
-            if cmds.objExists(propConn):
-                if self.propProperties[propConn][1] >= random.random(): #if the chance happens
-                    pos=cmds.xform(propConn,q=True, t=True, ws=True)
-                    
-                    self.spawnProp(self.propProperties[propConn][0])
-                    propName="prop"+str(self.propIndex)
-                    cmds.move(pos[0]-5,pos[1],pos[2]-5,propName)
-                    
-                    collided=False
-                    for union in self.collisionUnions:
-                        if detectCollision(union,propName):
-                            collided=True
-                            break
-                    if collided==False:
-                        collided=detectCollision("bedrock",propName)
-                        
-                    if collided:
-                        cmds.delete(propName)
-            
-    def generate(self):
-        #Generate Roots
-        self.generateRoots()        
-        cmds.refresh()
-        
-        #Create the initial universal collision box
-        for i in range(self.blockIndex+1):
-             self.addToCollisionUnion("collisionBox"+str(i))                    
-        
-        #Append Blocks
-        self.appendBlocks(amount=self.baseAmount,tag="base")        
-        cmds.refresh()
-        
-        self.appendBlocks(amount=self.structureAmount,tag="infrastructure")        
-        cmds.refresh()
-        
-        self.stairMaking(amount=self.structureAmount/2)        
-        cmds.refresh()
-        
-        self.pillarMaking()
-        cmds.refresh()
-        
-        self.propMaking()
-        
-        #Remove collision blocks
-        for union in self.collisionUnions:
-            cmds.delete(union)
-        for coll in self.collisionBoxes.values():
-            if cmds.objExists(coll):
-                cmds.delete(coll)
-        #Remove connectors
-        for conn in self.inputConnectorList+self.outputConnectorList:
-            if cmds.objExists(conn):
-                cmds.delete(conn)
-        for conn in self.pillarList:
-            if cmds.objExists(conn):
-                cmds.delete(conn)
-        for conn in self.propConnectors:
-            if cmds.objExists(conn):
-                cmds.delete(conn)
-        #Remove bedrock
-        cmds.delete("bedrock")
+    def generate(self,budget=None,cancelToken=None,progress=None):
+        self.compute(budget,cancelToken,progress)
+        self.commit()
+        
+    def save(self,path):
+        layoutfile.saveLayout(path,self.layout,self.dungeonBlocksData)
+        
+    def replay(self,path):
+        #rebuilds a saved layout in one pass: each preset is imported once, every placement
+        #instances its template
+        header,arrays=layoutfile.readLayout(path)
+        if header["catalog"]!=layoutfile.catalogVersion(self.dungeonBlocksData):
+            cmds.warning("The layout was saved with another catalog, presets may look different")
+        placements=[("block"+str(index),"rooms/"+preset,rotation,translation) for index,(preset,tag,rotation,translation)
+            in enumerate(layoutfile.placements(header,arrays,"blocks"))]
+        props=layoutfile.placements(header,arrays,"pillars")+layoutfile.placements(header,arrays,"props")
+        placements+=[("prop"+str(index),"props/"+preset,rotation,translation) for index,(preset,tag,rotation,translation)
+            in enumerate(props)]
+        
+        self.instantiate(placements,"dungeonLoad")
+        self.layout=layoutfile.layoutFromFile(header,arrays,self.dungeonBlocksData)
                     
 #---------------------------------------------------------------------------
 
@@ -581,8 +351,27 @@ class UI(object):
         cmds.text(label="Maximum Distance from Center")
         self.amountDistance=cmds.intField("Distance",minValue=100, maxValue=200, value=200)
         cmds.rowLayout(nc=8,p=self.column)
+        cmds.text(label="Time Budget (s, 0 for none)")
+        self.budget=cmds.floatField("Budget",minValue=0, value=0)
+        cmds.rowLayout(nc=8,p=self.column)
+        self.preciseCollision=cmds.checkBox(label="Precise Collision", value=False)
+        cmds.rowLayout(nc=8,p=self.column)
         self.generateButton=cmds.button("Generate", align="left",c=partial(self.generate))
-        
+        self.cancelButton=cmds.button("Cancel", align="left",c=partial(self.cancel))
+        cmds.rowLayout(nc=8,p=self.column)
+        self.progressBar=cmds.progressBar(maxValue=100,width=300)
+        cmds.rowLayout(nc=8,p=self.column)
+        self.flattenButton=cmds.button("Flatten Instances for Export", align="left",c=partial(self.flatten))
+        cmds.rowLayout(nc=8,p=self.column)
+        self.saveButton=cmds.button("Save Layout", align="left",c=partial(self.saveLayout))
+        self.loadButton=cmds.button("Load Layout", align="left",c=partial(self.loadLayout))
+        
+        self.cancelToken=None #token of the running generation
+        self.generator=None #DungeonGenerator of the temple in the scene
+        self.dungeonBlocksData=None #catalog shared by every click
+        self.manifest=None #resource files it was loaded from
+        self.lastProgress=0
+        self.setRunning(False)
         self.randomize()
     
     def randomize(self,*args):
@@ -592,16 +381,105 @@ class UI(object):
         generateSeed(newSeed)
         getVertexList()
     
+    def loadedCatalog(self):
+        #loaded once and kept, its compatibility bits fill up over the clicks; read again only
+        #when a resource file changed, appeared or disappeared
+        manifest=catalog.resourceManifest(workspacePath)
+        if self.dungeonBlocksData is None or manifest!=self.manifest:
+            self.dungeonBlocksData=catalog.loadCatalog(workspacePath)
+            self.manifest=manifest
+        return self.dungeonBlocksData
+        
     def generate(self,*args):
-        deleteAll()
-        DG=DungeonGenerator()
+        if self.cancelToken is not None: #a new Generate replaces the running one
+            self.cancelToken.cancel()
+        DG=DungeonGenerator(self.loadedCatalog())
+        DG.seed=cmds.textField(self.textF, q=True, text=True)
         DG.baseAmount=cmds.intField(self.amountBase,q=True,value=True)
         DG.structureAmount=cmds.intField(self.amountStructure,q=True,value=True)
         DG.distanceAmount=cmds.intField(self.amountDistance, q=True, value=True)
         DG.rootsAmount=cmds.floatField(self.amountRoots, q=True, value=True)
-        DG.generate()
-        currentSeed=cmds.textField(self.textF, q=True, text=True)
-        cmds.textField(self.textF, e=True, text=currentSeed)
+        DG.meshCollision=cmds.checkBox(self.preciseCollision, q=True, value=True)
+        budget=cmds.floatField(self.budget, q=True, value=True) or None
+        
+        token=control.CancelToken()
+        self.cancelToken=token
+        self.setRunning(True)
+        cmds.progressBar(self.progressBar,e=True,progress=0)
+        worker=threading.Thread(target=self.compute,args=(DG,budget,token))
+        worker.daemon=True
+        worker.start()
+        
+    def compute(self,DG,budget,token):
+        #worker thread - the scene is only changed in commit, back on the main thread
+        #every way out hands over to the main thread, which enables the controls again
+        try:
+            DG.compute(budget,token,partial(self.reportProgress,token))
+        except ValueError as error: #generation errors, worded for the user
+            maya.utils.executeDeferred(partial(self.fail,token,str(error)))
+            return
+        except Exception:
+            maya.utils.executeDeferred(partial(self.fail,token,"Generation failed\n"+traceback.format_exc()))
+            return
+        maya.utils.executeDeferred(partial(self.commit,DG,token))
+        
+    def reportProgress(self,token,stage,done,total):
+        #worker thread - hands at most ten updates a second over to the main thread
+        now=time.time()
+        if token is not self.cancelToken or now-self.lastProgress<0.1:
+            return
+        self.lastProgress=now
+        stageNames=[name for name,parameters in snapshots.STAGES]
+        fraction=stageNames.index(stage)+(float(done)/total if done and total else 0)
+        maya.utils.executeDeferred(partial(cmds.progressBar,self.progressBar,e=True,progress=int(100*fraction/len(stageNames))))
+        
+    def commit(self,DG,token):
+        if token is not self.cancelToken: #replaced by a newer Generate
+            return
+        self.cancelToken=None
+        try:
+            DG.commit() #replaces the previous temple, undo brings it back in one step
+        finally:
+            self.setRunning(False)
+        self.generator=DG
+        cmds.progressBar(self.progressBar,e=True,progress=100)
+        if DG.layout.interrupted:
+            cmds.warning("Generation stopped in the "+DG.layout.interrupted+" stage, the temple is partial")
+            
+    def fail(self,token,message):
+        if token is self.cancelToken:
+            self.cancelToken=None
+            self.setRunning(False)
+        cmds.warning(message)
+        
+    def setRunning(self,running):
+        #while a generation runs only Generate (which replaces it) and Cancel stay usable
+        for button in (self.flattenButton,self.saveButton,self.loadButton):
+            cmds.button(button,e=True,enable=not running)
+        cmds.button(self.cancelButton,e=True,enable=running)
+        
+    def cancel(self,*args):
+        if self.cancelToken is not None:
+            self.cancelToken.cancel()
+        
+    def flatten(self,*args):
+        flattenInstances()
+        
+    def saveLayout(self,*args):
+        if self.generator is None or self.generator.layout is None:
+            cmds.warning("Generate a temple before saving it")
+            return
+        path=cmds.fileDialog2(fileMode=0,fileFilter="Temple Layout (*.npz)",caption="Save Layout")
+        if path:
+            self.generator.save(path[0])
+            
+    def loadLayout(self,*args):
+        path=cmds.fileDialog2(fileMode=1,fileFilter="Temple Layout (*.npz)",caption="Load Layout")
+        if not path:
+            return
+        DG=DungeonGenerator(self.loadedCatalog())
+        DG.replay(path[0])
+        self.generator=DG
         
     def setSeed(self,*args):
         newSeed=cmds.textField(self.textF, q=True, text=True)
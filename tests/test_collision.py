@@ -0,0 +1,43 @@
+import pytest
+
+from dungeon.collision import CollisionWorld
+from dungeon.occupancy import OccupancyGrid
+
+
+def test_remove_frees_an_aligned_box():
+    world=CollisionWorld()
+    box=(0,0,0,20,10,30)
+    world.add(box)
+    assert world.collides(box)
+    world.remove(box)
+    assert world.grid.isFree(box)
+    assert not world.collides(box)
+    assert not world.collidesMany([box])[0]
+
+
+def test_remove_frees_an_off_lattice_box():
+    world=CollisionWorld()
+    box=(5,0,5,25,10,35)
+    world.add(box)
+    assert world.collides(box)
+    world.remove(box)
+    assert not world.collides(box)
+    assert not world.collidesMany([box])[0]
+
+
+def test_remove_keeps_overlapping_boxes():
+    world=CollisionWorld()
+    world.add((0,0,0,20,10,20))
+    world.add((10,0,10,30,10,30))
+    world.remove((0,0,0,20,10,20))
+    assert world.grid.isFree((0,0,0,10,10,10))
+    assert not world.grid.isFree((10,0,10,20,10,20))
+
+
+def test_unmark_of_a_free_box_changes_nothing():
+    grid=OccupancyGrid()
+    grid.mark((0,0,0,10,10,10))
+    with pytest.raises(ValueError):
+        grid.unmark((0,0,0,20,10,10))
+    assert not grid.isFree((0,0,0,10,10,10))
+    assert grid.isFree((10,0,0,20,10,10))
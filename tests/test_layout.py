@@ -0,0 +1,104 @@
+import argparse
+import os
+
+import numpy as np
+import pytest
+
+from dungeon import catalog, control, farm, layout, layoutfile, snapshots, terrain
+
+RESOURCES=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"dungeon_resources")
+
+
+@pytest.fixture(scope="module")
+def dungeonBlocksData():
+    return catalog.loadCatalog(RESOURCES)
+
+def flatTerrain(width,depth):
+    return terrain.Terrain([(x,50.0,z) for x in range(0,width+1,10) for z in range(0,depth+1,10)])
+
+def savedTemple(dungeonBlocksData,path,seed="1"):
+    generator=layout.LayoutGenerator(dungeonBlocksData,flatTerrain(400,400),seed)
+    generator.center=(200,200)
+    temple=generator.generate()
+    layoutfile.saveLayout(path,temple,dungeonBlocksData)
+    return temple
+
+
+def test_roots_outside_the_regions_fail_instead_of_looping(dungeonBlocksData):
+    #a region narrower than any base preset, every root drawn would be dropped
+    generator=layout.LayoutGenerator(dungeonBlocksData,flatTerrain(420,380),"1")
+    generator.center=(410,190)
+    generator.collisionWorld.regions=[(405,0,415,400)]
+    with pytest.raises(ValueError):
+        generator.generate()
+
+def test_roots_stay_inside_the_regions(dungeonBlocksData):
+    generator=layout.LayoutGenerator(dungeonBlocksData,flatTerrain(420,380),"1")
+    generator.center=(200,190)
+    generator.collisionWorld.regions=[(0,0,400,400)]
+    result=generator.generate()
+    boxes=np.array([block.box for block in result.blocks])
+    assert len(boxes) and generator.collisionWorld.insideRegions(boxes).all()
+
+def test_props_accepted_before_a_cancel_are_kept(dungeonBlocksData):
+    token=control.CancelToken()
+    generator=layout.LayoutGenerator(dungeonBlocksData,flatTerrain(400,400),"1")
+    generator.center=(200,200)
+    sampler=generator.sampler
+    def cancelAfterFirstTag(kind,tag=None):
+        #the second prop tag of the stage finds the token cancelled
+        if generator.currentStage=="props":
+            token.cancel()
+        return sampler(kind,tag)
+    generator.sampler=cancelAfterFirstTag
+    result=generator.generate(cancelToken=token)
+    assert result.interrupted=="props"
+    assert result.props
+    assert len(set(prop.tag for prop in result.props))==1
+
+def test_prop_spacing_has_to_be_positive():
+    assert farm.parsePropSpacing("tree=15")==("tree",15.0)
+    for value in ("tree=0","tree=-5","tree=nan","tree","tree=x"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            farm.parsePropSpacing(value)
+
+def test_a_stop_after_the_last_stage_keeps_the_layout_complete(dungeonBlocksData):
+    token=control.CancelToken()
+    def cancelOnceDone(stage,done,total):
+        if stage=="props" and done is None:
+            token.cancel()
+    cache=snapshots.StageCache()
+    generator=layout.LayoutGenerator(dungeonBlocksData,flatTerrain(400,400),"1",cache)
+    generator.center=(200,200)
+    result=generator.generate(cancelToken=token,progress=cancelOnceDone)
+    assert result.interrupted is None
+    assert len(cache)==len(snapshots.STAGES)
+
+def test_a_saved_layout_loads_back_identical(dungeonBlocksData,tmp_path):
+    path=str(tmp_path/"temple")
+    temple=savedTemple(dungeonBlocksData,path)
+    loaded=layoutfile.loadLayout(path,dungeonBlocksData)
+    assert temple.blocks and temple.pillars and temple.props
+    assert loaded.toDict()==temple.toDict()
+    for section in layoutfile.SECTIONS:
+        assert [placement.box for placement in getattr(loaded,section)]==[placement.box for placement in getattr(temple,section)]
+    assert layoutfile.readHeader(path)["counts"]=={"blocks":len(temple.blocks),"pillars":len(temple.pillars),"props":len(temple.props)}
+
+def test_diff_counts_kept_removed_and_added_placements(dungeonBlocksData,tmp_path):
+    firstPath=str(tmp_path/"first")
+    secondPath=str(tmp_path/"second")
+    temple=savedTemple(dungeonBlocksData,firstPath)
+    changed=layoutfile.loadLayout(firstPath,dungeonBlocksData)
+    moved=changed.blocks[-1]
+    moved.place(moved.rotation,(moved.translation[0]+1000,moved.translation[1],moved.translation[2]))
+    del changed.props[:2]
+    changed.parameters=dict(changed.parameters,baseAmount=changed.parameters["baseAmount"]+1)
+    layoutfile.saveLayout(secondPath,changed,dungeonBlocksData)
+
+    difference=layoutfile.diffLayouts(firstPath,secondPath)
+    assert difference["blocks"]=={"kept":len(temple.blocks)-1,"removed":1,"added":1}
+    assert difference["pillars"]=={"kept":len(temple.pillars),"removed":0,"added":0}
+    assert difference["props"]=={"kept":len(temple.props)-2,"removed":2,"added":0}
+    assert difference["parameters"]=={"baseAmount":[temple.parameters["baseAmount"],temple.parameters["baseAmount"]+1]}
+    assert difference["seed"] is None and not difference["catalogChanged"]
+    assert layoutfile.diffLayouts(firstPath,firstPath)["blocks"]=={"kept":len(temple.blocks),"removed":0,"added":0}
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pytest
+
+from dungeon import catalog
+from dungeon.meshcollision import MeshWorld, trianglesOverlap
+
+RESOURCES=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"dungeon_resources")
+
+
+@pytest.fixture(scope="module")
+def dungeonBlocksData():
+    return catalog.loadCatalog(RESOURCES)
+
+def placed(dungeonBlocksData,preset,translation):
+    #box and shape of a preset in rotation 0
+    translation=np.asarray(translation,dtype=float)
+    box=tuple((dungeonBlocksData["rotations"+preset].boxes[0]+np.tile(translation,2)).tolist())
+    return box,("rooms/"+preset,0,translation)
+
+def collides(dungeonBlocksData,first,second):
+    #first, second - (preset,translation)
+    world=MeshWorld(dungeonBlocksData["geometry"])
+    world.add(*placed(dungeonBlocksData,*first))
+    return world.collides(*placed(dungeonBlocksData,*second))
+
+
+def test_a_block_on_top_of_the_same_block_collides(dungeonBlocksData):
+    assert collides(dungeonBlocksData,("Block111",(0,0,0)),("Block111",(0,0,0)))
+
+def test_a_block_shifted_into_another_collides(dungeonBlocksData):
+    assert collides(dungeonBlocksData,("Block111",(0,0,0)),("Block111",(5,0,0)))
+    assert collides(dungeonBlocksData,("Block111",(0,0,0)),("Block111",(0,5,0)))
+
+def test_a_block_inside_another_collides(dungeonBlocksData):
+    assert collides(dungeonBlocksData,("BoxMed",(0,0,0)),("Block111",(5,0,5)))
+    assert collides(dungeonBlocksData,("Block111",(5,0,5)),("BoxMed",(0,0,0)))
+
+def test_an_enclosed_block_without_touching_faces_collides(dungeonBlocksData):
+    world=MeshWorld(dungeonBlocksData["geometry"])
+    library=world.library
+    outer=library.roots("rooms/BoxMed")[0]
+    inner=library.roots("rooms/Block111")[0]
+    assert library.encloses([outer],[inner],[(5,0,5)])[0]
+    assert not library.encloses([outer],[inner],[(30,0,5)])[0]
+
+def test_neighbouring_blocks_only_touch(dungeonBlocksData):
+    for translation in ((10,0,0),(0,10,0),(0,0,-10),(30,0,0)):
+        assert not collides(dungeonBlocksData,("Block111",(0,0,0)),("Block111",translation))
+
+def test_coplanar_triangles_collide_only_when_facing_the_same_way():
+    triangle=np.array([[[0,0,0],[10,0,0],[0,0,10]]],dtype=float)
+    flipped=triangle[:,::-1]
+    assert trianglesOverlap(triangle,triangle+(2,0,2))[0]
+    assert not trianglesOverlap(triangle,flipped+(2,0,2))[0]
+    assert not trianglesOverlap(triangle,triangle+(20,0,0))[0]
@@ -0,0 +1,84 @@
+import random
+
+import numpy as np
+
+from dungeon.sampling import ShuffledRange, WeightedSampler
+
+
+CHOICES=["zeroFirst","a","zeroMiddle","b","c","zeroLast"]
+WEIGHTS=[0,2,0,0.5,3,0]
+
+
+def weightedChoice(choices,chances,rng):
+    #the linear pick WeightedSampler replaced
+    max_chance=0
+    item_chance=[]
+    for i in range(len(choices)):
+        max_chance+=chances[i]
+        item_chance.append(max_chance)
+    choice=rng.random()*max_chance
+    for i in range(len(choices)):
+        if item_chance[i]>choice:
+            return choices[i]
+    return choices[len(choices)-1]
+
+
+class CountingRandom(random.Random):
+    def __init__(self,seed):
+        random.Random.__init__(self,seed)
+        self.draws=0
+
+    def random(self):
+        self.draws+=1
+        return random.Random.random(self)
+
+
+class FixedRandom(object):
+    def __init__(self,draw):
+        self.draw=draw
+
+    def random(self):
+        return self.draw
+
+
+def test_sampler_picks_like_the_linear_choice():
+    sampler=WeightedSampler(CHOICES,WEIGHTS)
+    old=CountingRandom(7)
+    new=CountingRandom(7)
+    for draw in range(2000):
+        assert sampler.sample(new)==weightedChoice(CHOICES,WEIGHTS,old)
+        assert new.draws==old.draws==draw+1
+    zeroWeight=set(choice for choice,weight in zip(CHOICES,WEIGHTS) if weight==0)
+    assert not zeroWeight&set(sampler.sampleMany(CountingRandom(8),2000))
+
+
+def test_sampler_batches_match_single_draws():
+    sampler=WeightedSampler(CHOICES,WEIGHTS)
+    single=CountingRandom(11)
+    batch=CountingRandom(11)
+    picks=[sampler.sample(single) for i in range(500)]
+    assert sampler.sampleMany(batch,500)==picks
+    assert batch.draws==single.draws==500
+
+
+def test_sampler_edges_match_the_linear_choice():
+    sampler=WeightedSampler(CHOICES,WEIGHTS)
+    total=float(sum(WEIGHTS))
+    draws=[0.0,2/total,2.5/total,0.999999999]
+    for draw in draws:
+        assert sampler.pick(draw)==weightedChoice(CHOICES,WEIGHTS,FixedRandom(draw))
+    assert sampler.pickMany(draws)==[sampler.pick(draw) for draw in draws]
+
+
+def test_shuffled_range_is_a_permutation_read_in_slices():
+    for size in (0,1,2,3,17,1000,4099):
+        pairs=ShuffledRange(size,np.random.default_rng(size))
+        values=[value for start in range(0,size,7) for value in pairs.take(start,start+7).tolist()]
+        assert sorted(values)==list(range(size))
+
+
+def test_shuffled_range_follows_the_seed():
+    first=ShuffledRange(500,np.random.default_rng(3)).take(0,500)
+    assert (first==ShuffledRange(500,np.random.default_rng(3)).take(0,500)).all()
+    assert (first!=ShuffledRange(500,np.random.default_rng(4)).take(0,500)).any()
+    assert (first!=np.arange(500)).any()